@@ -1,17 +1,36 @@
 # pylint: disable=no-self-argument,no-self-use,broad-except
+import asyncio
 import base64
+import functools
 import re
 import json
-from bs4 import BeautifulSoup
-from fastapi import FastAPI, Form, HTTPException
+from fastapi import FastAPI, Form, Header, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel, validator
 from . import utils
-from .crypto import elliptic_curve, block_cipher, sha3
 import html
+import os
+from enum import Enum
+from typing import Dict, List, Optional
+
+# crypto modules run on first use, so a worker only pays for the endpoint
+# families it actually serves
+elliptic_curve = utils.lazy_import(f"{__package__}.crypto.elliptic_curve")
+block_cipher = utils.lazy_import(f"{__package__}.crypto.block_cipher")
+enigma = utils.lazy_import(f"{__package__}.crypto.enigma")
+sha3 = utils.lazy_import(f"{__package__}.crypto.sha3")
+parallel_hash = utils.lazy_import(f"{__package__}.crypto.parallel_hash")
 
 app = FastAPI()
 
+# CTR payloads above this many bytes are encrypted on every core
+BLOCK_CIPHER_PARALLEL_THRESHOLD = 1024 * 1024
+
+# payloads above this many bytes are encrypted in a thread instead of on the
+# event loop; a single-process CBC pass takes about a second per 64 KB
+BLOCK_CIPHER_OFFLOAD_THRESHOLD = 16 * 1024
+
 origins = [
     "*"
 ]
@@ -26,6 +45,49 @@ app.add_middleware(
 )
 
 
+def warm_up_block_cipher() -> None:
+    block_cipher.BlockCipher(b'0123456789abcdef', key_cache=None).encrypt(b'warm up')
+
+
+def warm_up_enigma() -> None:
+    for rotor in enigma.EnigmaRotor:
+        enigma.compile_rotor(rotor)
+
+
+def warm_up_sha3() -> None:
+    sha3.SHA3(sha3.SHA3Instance.SHA256, b'warm up').digest()
+    parallel_hash.ParallelHash()
+
+
+def warm_up_elliptic_curve() -> None:
+    elliptic_curve.gen_ecdsa_public_key('1')
+
+
+WARM_UP = {
+    "block_cipher": warm_up_block_cipher,
+    "enigma": warm_up_enigma,
+    "sha3": warm_up_sha3,
+    "elliptic_curve": warm_up_elliptic_curve,
+}
+
+
+@app.on_event("startup")
+def warm_up() -> None:
+    """
+    Load the endpoint families listed in CRYPTO_WARM_UP (comma separated,
+    or "all") and build their tables before the first request
+    """
+    families = os.environ.get("CRYPTO_WARM_UP", "")
+    names = list(WARM_UP) if families.strip() == "all" else [name.strip() for name in families.split(",") if name.strip()]
+
+    unknown = [name for name in names if name not in WARM_UP]
+    if unknown:
+        raise ValueError(f'unknown CRYPTO_WARM_UP families {", ".join(unknown)}, must be "all" or any of {", ".join(WARM_UP)}')
+
+    for name in names:
+        WARM_UP[name]()
+
+
 @app.get("/", tags=["root"])
 async def read_root() -> dict:
     return {"message": "Cryptography Tugas 3 API"}
@@ -45,20 +107,58 @@ class BlockCipherEncryptRequest(BaseModel):
 
 class BlockCipherEncryptResponse(BaseModel):
     ciphertext: str
+    nonce: Optional[str] = None
+
+
+def build_block_cipher(key: bytes, mode: str, nonce: Optional[str], size: int) -> 'block_cipher.BlockCipher':
+    cipher_mode = block_cipher.BlockCipherMode(mode.lower())
+
+    # BlockCipher rejects a nonce outside CTR mode, so it is passed on for every mode
+    parallel = cipher_mode == block_cipher.BlockCipherMode.CTR and size > BLOCK_CIPHER_PARALLEL_THRESHOLD
+    workers = (os.cpu_count() or 1) if parallel else 1
+    return block_cipher.BlockCipher(
+        key,
+        mode=cipher_mode,
+        nonce=bytes.fromhex(nonce) if nonce else None,
+        workers=workers
+    )
+
+
+async def run_block_cipher(cipher: 'block_cipher.BlockCipher', transform, data: bytes) -> bytes:
+    """
+    Run cipher.encrypt or cipher.decrypt, in a thread for large payloads or
+    when it uses the process pool, so the event loop is not blocked
+    """
+    if cipher.workers <= 1 and len(data) <= BLOCK_CIPHER_OFFLOAD_THRESHOLD:
+        return transform(data)
+    return await asyncio.get_running_loop().run_in_executor(None, functools.partial(transform, data))
+
+
+def encode_block_cipher_text(ciphertext: bytes, mode: 'block_cipher.BlockCipherMode') -> str:
+    """
+    CTR output is returned as base64 (and expected back as base64). CBC
+    output is returned as text, as it always was, so it is only accepted
+    when the ciphertext bytes happen to be valid UTF-8; binary-safe CBC
+    goes through /block_cipher/encrypt_bytes and /decrypt_bytes
+    """
+    if mode == block_cipher.BlockCipherMode.CTR:
+        return utils.encode_binary(ciphertext, "base64").decode('ascii')
+    return ciphertext.decode('utf-8')
 
 
 @app.post("/block_cipher/encrypt", tags=["block_cipher"], response_model=BlockCipherEncryptResponse)
-async def block_cipher_encrypt(plaintext: str = Form(...), key: str = Form(...)) -> dict:
+async def block_cipher_encrypt(plaintext: str = Form(...), key: str = Form(...), mode: str = Form("cbc"), nonce: Optional[str] = Form(None)) -> dict:
     try:
         print("===== ENCRYPT =====")
         plaintext = bytes(plaintext, 'utf-8')
         key = bytes(key, 'utf-8')
-        cipher = block_cipher.BlockCipher(key)
-        ciphertext = cipher.encrypt(plaintext)
+        cipher = build_block_cipher(key, mode, nonce, len(plaintext))
+        ciphertext = await run_block_cipher(cipher, cipher.encrypt, plaintext)
         print('plaintext', plaintext, len(plaintext))
         print('ciphertext', ciphertext, len(plaintext))
         return {
-            "ciphertext": ciphertext.decode('utf-8')
+            "ciphertext": encode_block_cipher_text(ciphertext, cipher.mode),
+            "nonce": cipher.nonce.hex() if cipher.nonce else None
         }
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e)) from e
@@ -82,9 +182,19 @@ class BlockCipherDecryptResponse(BaseModel):
 
 
 @app.post("/block_cipher/decrypt", tags=["block_cipher"], response_model=BlockCipherDecryptResponse)
-async def block_cipher_decrypt(ciphertext: str = Form(...), key: str = Form(...)) -> dict:
+async def block_cipher_decrypt(ciphertext: str = Form(...), key: str = Form(...), mode: str = Form("cbc"), nonce: Optional[str] = Form(None)) -> dict:
     try:
         print("===== DECRYPT ======")
+        if mode.lower() == block_cipher.BlockCipherMode.CTR.value:
+            if not nonce:
+                raise ValueError('nonce is required to decrypt in CTR mode')
+            cipher = build_block_cipher(bytes(key, 'utf-8'), mode, nonce, len(ciphertext))
+            ciphertext = utils.decode_binary(ciphertext.strip().encode('ascii'), "base64")
+            plaintext = await run_block_cipher(cipher, cipher.decrypt, ciphertext)
+            return {
+                "plaintext": plaintext.decode('utf-8')
+            }
+
         start_index = ciphertext.find("<body>") + len("<body>")
         end_index = ciphertext.find("</body>")
 
@@ -93,6 +203,7 @@ async def block_cipher_decrypt(ciphertext: str = Form(...), key: str = Form(...)
         print("---- CIPHER -----")
         print(ciphertext)
 
+        from bs4 import BeautifulSoup
         soup = BeautifulSoup(ciphertext, 'html.parser')
         body_text = soup.body.get_text()
         print("=" * 20)
@@ -105,8 +216,8 @@ async def block_cipher_decrypt(ciphertext: str = Form(...), key: str = Form(...)
         print(ciphertext)
         print("=" * 20)
         key = bytes(key, 'utf-8')
-        cipher = block_cipher.BlockCipher(key) 
-        plaintext = cipher.decrypt(ciphertext)
+        cipher = build_block_cipher(key, mode, nonce, len(ciphertext))
+        plaintext = await run_block_cipher(cipher, cipher.decrypt, ciphertext)
         print('ciphertext', ciphertext)
         print("=" * 20)
         print('plaintext', plaintext)
@@ -117,6 +228,223 @@ async def block_cipher_decrypt(ciphertext: str = Form(...), key: str = Form(...)
         print(e)
         raise HTTPException(status_code=400, detail=str(e)) from e
 
+class RequestStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse produced while the request body is still being read.
+    request.stream() reports disconnects itself, so this response must not
+    race it for receive() with a disconnect listener.
+    """
+    async def __call__(self, scope, receive, send) -> None:
+        await self.stream_response(send)
+
+        if self.background is not None:
+            await self.background()
+
+
+async def stream_block_cipher(request: Request, stream: 'block_cipher.BlockCipherStream'):
+    # every chunk is encrypted in a thread, keeping the event loop free
+    loop = asyncio.get_running_loop()
+    async for chunk in request.stream():
+        output = await loop.run_in_executor(None, stream.update, chunk)
+        if output:
+            yield output
+
+    output = await loop.run_in_executor(None, stream.finalize)
+    if output:
+        yield output
+
+
+@app.post("/block_cipher/encrypt_stream", tags=["block_cipher"], response_class=StreamingResponse)
+async def block_cipher_encrypt_stream(request: Request, x_key: str = Header(...), x_mode: str = Header("cbc"), x_nonce: Optional[str] = Header(None)) -> StreamingResponse:
+    try:
+        cipher = build_block_cipher(bytes(x_key, 'utf-8'), x_mode, x_nonce, 0)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+
+    headers = {"X-Nonce": cipher.nonce.hex()} if cipher.nonce else None
+    return RequestStreamingResponse(
+        stream_block_cipher(request, cipher.encryptor()),
+        media_type="application/octet-stream",
+        headers=headers
+    )
+
+
+@app.post("/block_cipher/decrypt_stream", tags=["block_cipher"], response_class=StreamingResponse)
+async def block_cipher_decrypt_stream(request: Request, x_key: str = Header(...), x_mode: str = Header("cbc"), x_nonce: Optional[str] = Header(None)) -> StreamingResponse:
+    try:
+        if x_mode.lower() == block_cipher.BlockCipherMode.CTR.value and not x_nonce:
+            raise ValueError('nonce is required to decrypt in CTR mode')
+        cipher = build_block_cipher(bytes(x_key, 'utf-8'), x_mode, x_nonce, 0)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+
+    return RequestStreamingResponse(
+        stream_block_cipher(request, cipher.decryptor()),
+        media_type="application/octet-stream"
+    )
+
+class BinaryEncoding(str, Enum):
+    RAW = "raw"
+    BASE64 = "base64"
+    HEX = "hex"
+
+
+async def read_binary_body(request: Request) -> bytes:
+    """
+    Raw request body, or the `file` field of a multipart upload
+    """
+    if request.headers.get("content-type", "").startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("file")
+        if upload is None or isinstance(upload, str):
+            raise ValueError('multipart body must contain a file field')
+        return await upload.read()
+
+    return await request.body()
+
+
+def binary_response(data: bytes, encoding: BinaryEncoding, headers: Optional[dict] = None) -> Response:
+    media_type = "application/octet-stream" if encoding == BinaryEncoding.RAW else "text/plain"
+    return Response(content=utils.encode_binary(data, encoding.value), media_type=media_type, headers=headers)
+
+
+@app.post("/block_cipher/encrypt_bytes", tags=["block_cipher"], response_class=Response)
+async def block_cipher_encrypt_bytes(request: Request, encoding: BinaryEncoding = BinaryEncoding.RAW, input_encoding: BinaryEncoding = BinaryEncoding.RAW, x_key: str = Header(...), x_mode: str = Header("cbc"), x_nonce: Optional[str] = Header(None)) -> Response:
+    try:
+        plaintext = utils.decode_binary(await read_binary_body(request), input_encoding.value)
+        cipher = build_block_cipher(bytes(x_key, 'utf-8'), x_mode, x_nonce, len(plaintext))
+        ciphertext = await run_block_cipher(cipher, cipher.encrypt, memoryview(plaintext))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+
+    headers = {"X-Nonce": cipher.nonce.hex()} if cipher.nonce else None
+    return binary_response(ciphertext, encoding, headers)
+
+
+@app.post("/block_cipher/decrypt_bytes", tags=["block_cipher"], response_class=Response)
+async def block_cipher_decrypt_bytes(request: Request, encoding: BinaryEncoding = BinaryEncoding.RAW, input_encoding: BinaryEncoding = BinaryEncoding.RAW, x_key: str = Header(...), x_mode: str = Header("cbc"), x_nonce: Optional[str] = Header(None)) -> Response:
+    try:
+        if x_mode.lower() == block_cipher.BlockCipherMode.CTR.value and not x_nonce:
+            raise ValueError('nonce is required to decrypt in CTR mode')
+        ciphertext = utils.decode_binary(await read_binary_body(request), input_encoding.value)
+        cipher = build_block_cipher(bytes(x_key, 'utf-8'), x_mode, x_nonce, len(ciphertext))
+        plaintext = await run_block_cipher(cipher, cipher.decrypt, memoryview(ciphertext))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+
+    return binary_response(plaintext, encoding)
+
+class BlockCipherKeyCacheResponse(BaseModel):
+    size: int
+    maxsize: int
+    ttl: Optional[float]
+    hits: int
+    misses: int
+    hit_rate: float
+
+
+@app.get("/block_cipher/key_cache", tags=["block_cipher"], response_model=BlockCipherKeyCacheResponse)
+async def block_cipher_key_cache() -> dict:
+    return block_cipher.KEY_SCHEDULE_CACHE.stats()
+
+class EnigmaEncryptRequest(BaseModel):
+    texts: List[str]
+    rotors: List[str] = ["I", "II", "III"]
+    positions: List[int] = [0, 0, 0]
+    rings: List[int] = [0, 0, 0]
+    plugboard: Dict[str, str] = {}
+
+    @validator('rotors')
+    def validate_rotors(cls, rotors):
+        if any(rotor not in enigma.EnigmaRotor.__members__ for rotor in rotors):
+            raise ValueError(f'rotors must be one of {", ".join(enigma.EnigmaRotor.__members__)}')
+        return rotors
+
+
+class EnigmaEncryptResponse(BaseModel):
+    ciphertexts: List[str]
+
+
+@app.post("/enigma/encrypt", tags=["enigma"], response_model=EnigmaEncryptResponse)
+async def enigma_encrypt(request: EnigmaEncryptRequest) -> dict:
+    try:
+        rotors = [enigma.EnigmaRotor[rotor] for rotor in request.rotors]
+        ciphertexts = []
+        # every text is a separate message, starting from the same settings
+        for text in request.texts:
+            machine = enigma.EnigmaMachine(rotors, request.positions, request.rings, request.plugboard)
+            ciphertexts.append(machine.encrypt(utils.uppercase_and_filter_alphabets(text)))
+        return {"ciphertexts": ciphertexts}
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+
+class SHA3Variant(str, Enum):
+    SHA3_224 = "sha3_224"
+    SHA3_256 = "sha3_256"
+    SHA3_384 = "sha3_384"
+    SHA3_512 = "sha3_512"
+    PARALLELHASH128 = "parallelhash128"
+    PARALLELHASH256 = "parallelhash256"
+
+
+# SHA3Instance member names, looked up once the sha3 module is in use
+SHA3_INSTANCES = {
+    SHA3Variant.SHA3_224: "SHA224",
+    SHA3Variant.SHA3_256: "SHA256",
+    SHA3Variant.SHA3_384: "SHA384",
+    SHA3Variant.SHA3_512: "SHA512",
+    SHA3Variant.PARALLELHASH128: "SHAKE128",
+    SHA3Variant.PARALLELHASH256: "SHAKE256",
+}
+
+
+def build_sha3_hasher(variant: SHA3Variant):
+    instance = sha3.SHA3Instance[SHA3_INSTANCES[variant]]
+    if variant in (SHA3Variant.PARALLELHASH128, SHA3Variant.PARALLELHASH256):
+        return parallel_hash.ParallelHash(instance, workers=os.cpu_count() or 1)
+    return sha3.SHA3(instance)
+
+
+class SHA3DigestResponse(BaseModel):
+    algorithm: str
+    digest: str
+    length: int
+
+
+@app.post("/sha3/digest", tags=["sha3"], response_model=SHA3DigestResponse)
+async def sha3_digest(request: Request, instance: SHA3Variant = SHA3Variant.SHA3_256) -> dict:
+    """
+    Hash the raw request body, or the `file` field of a multipart upload,
+    absorbing it chunk by chunk as it arrives. Hashing runs in a thread,
+    so the event loop keeps serving other requests meanwhile.
+    """
+    hasher = build_sha3_hasher(instance)
+    loop = asyncio.get_running_loop()
+    length = 0
+
+    try:
+        if request.headers.get("content-type", "").startswith("multipart/form-data"):
+            # multipart uploads are spooled to disk, so read the file back in chunks
+            form = await request.form()
+            upload = form.get("file")
+            if upload is None or isinstance(upload, str):
+                raise ValueError('multipart body must contain a file field')
+            await upload.seek(0)
+            await loop.run_in_executor(None, hasher.update_file, upload.file)
+            length = upload.file.tell()
+        else:
+            async for chunk in request.stream():
+                await loop.run_in_executor(None, hasher.update, chunk)
+                length += len(chunk)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+
+    return {
+        "algorithm": hasher.name,
+        "digest": await loop.run_in_executor(None, hasher.hexdigest),
+        "length": length
+    }
+
 class ECGenerateKeyResponse(BaseModel):
     private_key: str
     public_key: str
@@ -153,9 +481,9 @@ async def digital_sign(plaintext: str = Form(...), private_key: str = Form(...))
         private_key = int(private_key, 16)
 
         sha3_instance = sha3.SHA3(sha3.SHA3Instance.SHA256)
+        sha3_instance.update(plaintext.encode('utf-8'))
 
-        hex_digits = sha3_instance.digest(plaintext)
-        hash_digest = utils.convert_hex_digits_to_int_16(hex_digits)
+        hash_digest = int(sha3_instance.hexdigest(), 16)
 
         signature = elliptic_curve.sign(private_key, hash_digest)
 
@@ -193,9 +521,9 @@ async def digital_sign_verify(plaintext: str = Form(...), signature_base64: str
         # plaintext, signature_base64 = utils.extract_signature_from_message(plaintext_with_signature)
 
         sha3_instance = sha3.SHA3(sha3.SHA3Instance.SHA256)
+        sha3_instance.update(plaintext.encode('utf-8'))
 
-        hex_digits = sha3_instance.digest(plaintext)
-        hash_digest = utils.convert_hex_digits_to_int_16(hex_digits)
+        hash_digest = int(sha3_instance.hexdigest(), 16)
 
         signature_json = utils.convert_base64_to_str(signature_base64)
         signature_dict = json.loads(signature_json)
@@ -209,4 +537,17 @@ async def digital_sign_verify(plaintext: str = Form(...), signature_base64: str
         }
     except Exception as e:
         print(e)
-        raise HTTPException(status_code=400, detail=str(e)) from e
\ No newline at end of file
+        raise HTTPException(status_code=400, detail=str(e)) from e
+
+class ECPublicKeyCacheResponse(BaseModel):
+    size: int
+    maxsize: int
+    ttl: Optional[float]
+    hits: int
+    misses: int
+    hit_rate: float
+
+
+@app.get("/elliptic_curve/public_key_cache", tags=["elliptic_curve"], response_model=ECPublicKeyCacheResponse)
+async def elliptic_curve_public_key_cache() -> dict:
+    return elliptic_curve.PUBLIC_KEY_CACHE.stats()
@@ -1,17 +1,193 @@
-from typing import List, Tuple
+from enum import Enum
+from typing import Iterator, List, NamedTuple, Optional, Tuple
+import os
 from .enigma_bytes import EnigmaBytesMachine, EnigmaBytesRotor
+from .lru_cache import LRUCache
+from .pbox import PBox
+from .process_pool import shared_process_pool
 
 def byte_xor(ba1, ba2):
     return bytes([a ^ b for a, b in zip(ba1, ba2)])
 
+EXPANSION_PBOX = [
+    37, 26, 26, 8, 4, 7, 3, 1, 19, 34, 
+    29, 57, 30, 48, 12, 63, 32, 45, 11, 49, 
+    27, 33, 41, 46, 15, 28, 60, 31, 20, 5, 
+    61, 35, 54, 45, 39, 53, 41, 10, 2, 25, 
+    1, 53, 35, 22, 12, 11, 50, 40, 36, 48, 
+    56, 49, 56, 50, 31, 59, 13, 42, 24, 39, 
+    20, 44, 28, 29, 16, 46, 37, 62, 52, 3, 
+    51, 51, 59, 14, 27, 40, 17, 14, 52, 38, 
+    55, 44, 58, 18, 9, 2, 61, 34, 33, 25, 
+    47, 8, 55, 21, 0, 5, 10, 24, 13, 6, 
+    54, 17, 30, 9, 6, 42, 62, 36, 38, 15, 
+    43, 43, 7, 60, 23, 22, 63, 23, 18, 4, 
+    21, 0, 16, 19, 57, 47, 58, 32
+]
+
+EXPANSION = PBox(EXPANSION_PBOX)
+
+SBOXES = {
+    0: [
+        [0x7E, 0x16, 0x75, 0x14, 0x18, 0x09, 0x78, 0x3F, 0x24, 0x6D, 0x1B, 0x52, 0x2A, 0x3D, 0x67, 0x45],
+        [0x5C, 0x5D, 0x5E, 0x5F, 0x60, 0x61, 0x62, 0x63, 0x64, 0x65, 0x66, 0x67, 0x68, 0x69, 0x6A, 0x6B],
+    ],
+    1: [
+        [0x3F, 0x3E, 0x3D, 0x3C, 0x3B, 0x3A, 0x39, 0x38, 0x37, 0x36, 0x35, 0x34, 0x33, 0x32, 0x31, 0x30],
+        [0x6B, 0x6A, 0x69, 0x68, 0x67, 0x66, 0x65, 0x64, 0x63, 0x62, 0x61, 0x60, 0x5F, 0x5E, 0x5D, 0x5C],
+    ],
+    2: [
+        [0x45, 0x67, 0x3D, 0x2A, 0x1B, 0x24, 0x52, 0x6D, 0x3F, 0x78, 0x09, 0x18, 0x14, 0x75, 0x16, 0x7E],
+        [0x1E, 0x1F, 0x20, 0x21, 0x22, 0x23, 0x24, 0x25, 0x26, 0x27, 0x28, 0x29, 0x2A, 0x2B, 0x2C, 0x2D],
+    ],
+    3: [
+        [0x7E, 0x16, 0x75, 0x14, 0x18, 0x09, 0x78, 0x3F, 0x24, 0x6D, 0x1B, 0x52, 0x2A, 0x3D, 0x67, 0x45],
+        [0x5C, 0x5D, 0x5E, 0x5F, 0x60, 0x61, 0x62, 0x63, 0x64, 0x65, 0x66, 0x67, 0x68, 0x69, 0x6A, 0x6B],
+    ],
+    4: [
+        [0x3F, 0x3E, 0x3D, 0x3C, 0x3B, 0x3A, 0x39, 0x38, 0x37, 0x36, 0x35, 0x34, 0x33, 0x32, 0x31, 0x30],
+        [0x6B, 0x6A, 0x69, 0x68, 0x67, 0x66, 0x65, 0x64, 0x63, 0x62, 0x61, 0x60, 0x5F, 0x5E, 0x5D, 0x5C],
+    ],
+    5: [
+        [0x45, 0x67, 0x3D, 0x2A, 0x1B, 0x24, 0x52, 0x6D, 0x3F, 0x78, 0x09, 0x18, 0x14, 0x75, 0x16, 0x7E],
+        [0x1E, 0x1F, 0x20, 0x21, 0x22, 0x23, 0x24, 0x25, 0x26, 0x27, 0x28, 0x29, 0x2A, 0x2B, 0x2C, 0x2D],
+    ],
+    6: [
+        [0x1E, 0x1F, 0x20, 0x21, 0x22, 0x23, 0x24, 0x25, 0x26, 0x27, 0x28, 0x29, 0x2A, 0x2B, 0x2C, 0x2D],
+        [0x3F, 0x3E, 0x3D, 0x3C, 0x3B, 0x3A, 0x39, 0x38, 0x37, 0x36, 0x35, 0x34, 0x33, 0x32, 0x31, 0x30],
+    ],
+    7: [
+        [0x5C, 0x5D, 0x5E, 0x5F, 0x60, 0x61, 0x62, 0x63, 0x64, 0x65, 0x66, 0x67, 0x68, 0x69, 0x6A, 0x6B],
+        [0x45, 0x67, 0x3D, 0x2A, 0x1B, 0x24, 0x52, 0x6D, 0x3F, 0x78, 0x09, 0x18, 0x14, 0x75, 0x16, 0x7E],
+    ]
+}
+
+SHIFTS = [1,1,2,2,2,2,2,2,1,2,2,2,2,2,2,1]
+
+MASK_64 = (1 << 64) - 1
+
+# Per 2-byte block of the S-box input, the low byte of
+# ((x >> 8) ^ x) & SBOX_ROW_MASK | (x >> 8) & SBOX_COL_MASK
+# holds the row in its top bit and the column in its low nibble
+SBOX_ROW_MASK = int.from_bytes(b'\x00\x80' * 8, byteorder='big')
+SBOX_COL_MASK = int.from_bytes(b'\x00\x0f' * 8, byteorder='big')
+
+def compile_sbox(sbox: List[List[int]], shift: int) -> List[int]:
+    """
+    Flatten a 2x16 S-box into a 256-entry table indexed by row << 7 | col,
+    with the output already shifted into its place in the round output
+    """
+    return [sbox[index >> 7][index & 0x0F] << shift for index in range(256)]
+
+SBOX_TABLES = [compile_sbox(SBOXES[i], 56 - 8 * i) for i in range(len(SBOXES))]
+
+class ExpandedKey(NamedTuple):
+    # round subkeys of the first block
+    subkeys: Tuple[int, ...]
+    # (positions, rings) of every key schedule machine once the first block is done
+    states: Tuple[Tuple[Tuple[int, ...], Tuple[int, ...]], ...]
+
+# Expanded keys shared across BlockCipher instances, keyed by the key bytes
+KEY_SCHEDULE_CACHE = LRUCache(
+    maxsize=int(os.environ.get('BLOCK_CIPHER_KEY_CACHE_SIZE', 256)),
+    ttl=float(os.environ.get('BLOCK_CIPHER_KEY_CACHE_TTL', 600)),
+)
+
+class BlockCipherMode(Enum):
+    CBC = 'cbc'
+    CTR = 'ctr'
+
+# CTR inputs and CBC ciphertexts are split into chunks of this many bytes for the worker pool
+PARALLEL_CHUNK_SIZE = 64 * 1024
+
+# CTR inputs of at least this many blocks get their keystream from BlockCipherBatch
+BATCH_MIN_BLOCKS = 64
+
+# CBC inputs of at least this many blocks get their subkeys from EnigmaBytesBatch,
+# SUBKEY_BATCH_BLOCKS blocks at a time
+SUBKEY_BATCH_MIN_BLOCKS = 512
+SUBKEY_BATCH_BLOCKS = 4096
+
+def _ctr_chunk(key: bytes, nonce: bytes, expanded_key: ExpandedKey, first_block: int, data: bytes) -> bytes:
+    cipher = BlockCipher(key, key_cache=None, mode=BlockCipherMode.CTR, nonce=nonce)
+    cipher._expanded_key = expanded_key
+    return cipher.ctr_transform(data, first_block)
+
+def _cbc_decrypt_chunk(key: bytes, expanded_key: ExpandedKey, first_block: int, previous: bytes, data: bytes) -> bytes:
+    cipher = BlockCipher(key, key_cache=None)
+    cipher._expanded_key = expanded_key
+    return cipher.cbc_decrypt_range(data, first_block, previous)
+
 class BlockCipher():
     IV= b'\x00' * 16
 
-    def __init__(self, key: bytes):
+    '''
+    Block cipher constructor
+    Arguments:
+        key: 16 byte key
+        key_cache: cache of expanded keys shared between instances, None to disable
+        mode: CBC chaining against IV, or CTR keystream
+        nonce: 8 byte CTR nonce, random when not given
+        workers: processes used for large CTR inputs and CBC decryption,
+            from the process pool shared by every cipher with this many workers
+    '''
+    def __init__(
+        self,
+        key: bytes,
+        key_cache: Optional[LRUCache] = KEY_SCHEDULE_CACHE,
+        mode: BlockCipherMode = BlockCipherMode.CBC,
+        nonce: Optional[bytes] = None,
+        workers: int = 1,
+    ):
         if len(key) != 16:
             raise ValueError('key length must be of size 16 bytes')
 
-        self.key = key
+        if mode == BlockCipherMode.CTR:
+            if nonce is None:
+                nonce = os.urandom(8)
+            if len(nonce) != 8:
+                raise ValueError('nonce length must be of size 8 bytes')
+        elif nonce is not None:
+            raise ValueError('nonce is only used in CTR mode')
+
+        self.key = bytes(key)
+        self.key_cache = key_cache
+        self.mode = mode
+        self.nonce = nonce
+        self.workers = workers
+        self._expanded_key: Optional[ExpandedKey] = None
+
+    @property
+    def expanded_key(self) -> ExpandedKey:
+        if self._expanded_key is None:
+            if self.key_cache is None:
+                self._expanded_key = self.expand_key()
+            else:
+                self._expanded_key = self.key_cache.get_or_create(self.key, self.expand_key)
+        return self._expanded_key
+
+    def expand_key(self) -> ExpandedKey:
+        key_schedules = []
+        subkeys = self.next_subkeys(key_schedules)
+        states = tuple(
+            (tuple(key_schedule.rotor_positions), tuple(key_schedule.rings))
+            for key_schedule in key_schedules
+        )
+        return ExpandedKey(tuple(subkeys), states)
+
+    def load_key_schedules(self, expanded_key: ExpandedKey) -> List[EnigmaBytesMachine]:
+        return [
+            self._key_schedule_machine(list(positions), list(rings))
+            for positions, rings in expanded_key.states
+        ]
+
+    def _key_schedule_machine(self, positions: List[int], rings: List[int]) -> EnigmaBytesMachine:
+        return EnigmaBytesMachine(
+            rotors=[EnigmaBytesRotor.I, EnigmaBytesRotor.I, EnigmaBytesRotor.I],
+            positions=positions,
+            rings=rings,
+            plugboard={}
+        )
 
     def build_key_schedule(self, key: bytes, shift: int) -> EnigmaBytesMachine:
         c_start = key[:8]
@@ -26,13 +202,7 @@ class BlockCipher():
         positions = [int(c) for c in three_c]
         rings = [int(d) for d in three_d]
 
-        encryptor = EnigmaBytesMachine(
-            rotors=[EnigmaBytesRotor.I, EnigmaBytesRotor.I, EnigmaBytesRotor.I],
-            positions=positions, 
-            rings=rings, 
-            plugboard={}
-        )
-        return encryptor
+        return self._key_schedule_machine(positions, rings)
     
     def bits(self, l: bytes):
         for n in l:
@@ -80,23 +250,8 @@ class BlockCipher():
         return b''.join(blocks)
     
     def expansion(self, data: bytes) -> bytes:
-        pbox = [
-            37, 26, 26, 8, 4, 7, 3, 1, 19, 34, 
-            29, 57, 30, 48, 12, 63, 32, 45, 11, 49, 
-            27, 33, 41, 46, 15, 28, 60, 31, 20, 5, 
-            61, 35, 54, 45, 39, 53, 41, 10, 2, 25, 
-            1, 53, 35, 22, 12, 11, 50, 40, 36, 48, 
-            56, 49, 56, 50, 31, 59, 13, 42, 24, 39, 
-            20, 44, 28, 29, 16, 46, 37, 62, 52, 3, 
-            51, 51, 59, 14, 27, 40, 17, 14, 52, 38, 
-            55, 44, 58, 18, 9, 2, 61, 34, 33, 25, 
-            47, 8, 55, 21, 0, 5, 10, 24, 13, 6, 
-            54, 17, 30, 9, 6, 42, 62, 36, 38, 15, 
-            43, 43, 7, 60, 23, 22, 63, 23, 18, 4, 
-            21, 0, 16, 19, 57, 47, 58, 32
-        ]
-        return self.apply_pbox(data, pbox)
-    
+        return EXPANSION.permute(data)
+
     def round_function(self, data: bytes, subkey: bytes) -> bytes:
         expansion_result = self.expansion(data)
         assert(len(expansion_result) == len(subkey))
@@ -105,44 +260,26 @@ class BlockCipher():
             for x, y in zip(expansion_result, subkey)
         )
 
-        sboxes = {
-            0: [
-                [0x7E, 0x16, 0x75, 0x14, 0x18, 0x09, 0x78, 0x3F, 0x24, 0x6D, 0x1B, 0x52, 0x2A, 0x3D, 0x67, 0x45],
-                [0x5C, 0x5D, 0x5E, 0x5F, 0x60, 0x61, 0x62, 0x63, 0x64, 0x65, 0x66, 0x67, 0x68, 0x69, 0x6A, 0x6B],
-            ],
-            1: [
-                [0x3F, 0x3E, 0x3D, 0x3C, 0x3B, 0x3A, 0x39, 0x38, 0x37, 0x36, 0x35, 0x34, 0x33, 0x32, 0x31, 0x30],
-                [0x6B, 0x6A, 0x69, 0x68, 0x67, 0x66, 0x65, 0x64, 0x63, 0x62, 0x61, 0x60, 0x5F, 0x5E, 0x5D, 0x5C],
-            ],
-            2: [
-                [0x45, 0x67, 0x3D, 0x2A, 0x1B, 0x24, 0x52, 0x6D, 0x3F, 0x78, 0x09, 0x18, 0x14, 0x75, 0x16, 0x7E],
-                [0x1E, 0x1F, 0x20, 0x21, 0x22, 0x23, 0x24, 0x25, 0x26, 0x27, 0x28, 0x29, 0x2A, 0x2B, 0x2C, 0x2D],
-            ],
-            3: [
-                [0x7E, 0x16, 0x75, 0x14, 0x18, 0x09, 0x78, 0x3F, 0x24, 0x6D, 0x1B, 0x52, 0x2A, 0x3D, 0x67, 0x45],
-                [0x5C, 0x5D, 0x5E, 0x5F, 0x60, 0x61, 0x62, 0x63, 0x64, 0x65, 0x66, 0x67, 0x68, 0x69, 0x6A, 0x6B],
-            ],
-            4: [
-                [0x3F, 0x3E, 0x3D, 0x3C, 0x3B, 0x3A, 0x39, 0x38, 0x37, 0x36, 0x35, 0x34, 0x33, 0x32, 0x31, 0x30],
-                [0x6B, 0x6A, 0x69, 0x68, 0x67, 0x66, 0x65, 0x64, 0x63, 0x62, 0x61, 0x60, 0x5F, 0x5E, 0x5D, 0x5C],
-            ],
-            5: [
-                [0x45, 0x67, 0x3D, 0x2A, 0x1B, 0x24, 0x52, 0x6D, 0x3F, 0x78, 0x09, 0x18, 0x14, 0x75, 0x16, 0x7E],
-                [0x1E, 0x1F, 0x20, 0x21, 0x22, 0x23, 0x24, 0x25, 0x26, 0x27, 0x28, 0x29, 0x2A, 0x2B, 0x2C, 0x2D],
-            ],
-            6: [
-                [0x1E, 0x1F, 0x20, 0x21, 0x22, 0x23, 0x24, 0x25, 0x26, 0x27, 0x28, 0x29, 0x2A, 0x2B, 0x2C, 0x2D],
-                [0x3F, 0x3E, 0x3D, 0x3C, 0x3B, 0x3A, 0x39, 0x38, 0x37, 0x36, 0x35, 0x34, 0x33, 0x32, 0x31, 0x30],
-            ],
-            7: [
-                [0x5C, 0x5D, 0x5E, 0x5F, 0x60, 0x61, 0x62, 0x63, 0x64, 0x65, 0x66, 0x67, 0x68, 0x69, 0x6A, 0x6B],
-                [0x45, 0x67, 0x3D, 0x2A, 0x1B, 0x24, 0x52, 0x6D, 0x3F, 0x78, 0x09, 0x18, 0x14, 0x75, 0x16, 0x7E],
-            ]
-        }
-
-        b = self.apply_sbox(a, sboxes)
+        b = self.apply_sbox(a, SBOXES)
 
         return b
+
+    def round_function_int(self, data: int, subkey: int) -> int:
+        a = EXPANSION.permute_int(data) ^ subkey
+        high = a >> 8
+        index = ((high ^ a) & SBOX_ROW_MASK) | (high & SBOX_COL_MASK)
+
+        t0, t1, t2, t3, t4, t5, t6, t7 = SBOX_TABLES
+        return (
+            t0[index >> 112]
+            | t1[(index >> 96) & 0xFF]
+            | t2[(index >> 80) & 0xFF]
+            | t3[(index >> 64) & 0xFF]
+            | t4[(index >> 48) & 0xFF]
+            | t5[(index >> 32) & 0xFF]
+            | t6[(index >> 16) & 0xFF]
+            | t7[index & 0xFF]
+        )
     
     def feistel_network_for_encrypt(self, left: bytes, right: bytes, subkey: bytes) -> Tuple[bytes, bytes]:
         new_left = right
@@ -160,81 +297,272 @@ class BlockCipher():
         )
         return new_left, new_right
 
-    def encrypt(self, plaintext: bytes) -> bytes:
-        # Make sure plaintext is a multiple of 16 bytes (128 bits)
-        if len(plaintext) % 16 != 0:
-            padding = b'\x00' * (16 - len(plaintext) % 16)
-            plaintext = plaintext + padding
+    def next_subkeys(self, key_schedules: List[EnigmaBytesMachine]) -> List[int]:
+        """
+        Produce the 16 round subkeys of the next block as 128-bit integers.
+        Key schedules are built while deriving the first block's subkeys.
+        """
+        subkeys = []
+        subkey = self.key
+        for i in range(16):
+            if i < len(key_schedules):
+                key_schedule = key_schedules[i]
+            else:
+                key_schedule = self.build_key_schedule(subkey, SHIFTS[i])
+                key_schedules.append(key_schedule)
+
+            subkey = key_schedule.encrypt(subkey)
+            subkeys.append(int.from_bytes(subkey, byteorder='big'))
+        return subkeys
+
+    def iter_subkeys(self, first_block: int = 0, count: Optional[int] = None) -> Iterator[List[int]]:
+        """
+        Yield the round subkeys of block first_block, first_block + 1, ...
+        starting from the expanded key. When count is given and large enough,
+        the subkeys are produced SUBKEY_BATCH_BLOCKS blocks at a time.
+        """
+        if count is not None and count >= SUBKEY_BATCH_MIN_BLOCKS:
+            for start in range(first_block, first_block + count, SUBKEY_BATCH_BLOCKS):
+                yield from self.subkeys_range(start, min(SUBKEY_BATCH_BLOCKS, first_block + count - start))
+            return
+
+        expanded_key = self.expanded_key
+        if first_block == 0:
+            yield list(expanded_key.subkeys)
+            first_block = 1
+
+        # every block moves each key schedule on by one 16 byte subkey
+        key_schedules = self.load_key_schedules(expanded_key)
+        for key_schedule in key_schedules:
+            key_schedule.advance((first_block - 1) * 16)
+
+        while True:
+            yield self.next_subkeys(key_schedules)
+
+    def subkeys_at(self, block: int) -> List[int]:
+        return next(self.iter_subkeys(block))
+
+    def subkeys_range(self, first_block: int, count: int) -> List[List[int]]:
+        """
+        Round subkeys of count blocks from first_block. Every key schedule
+        encrypts the subkeys of all the blocks at once, as one batch of
+        machines placed at each block's offset.
+        """
+        from .enigma_bytes_batch import EnigmaBytesBatch
+        import numpy as np
+
+        expanded_key = self.expanded_key
+        result = []
+        if first_block == 0 and count > 0:
+            result.append(list(expanded_key.subkeys))
+            first_block, count = 1, count - 1
+        if count <= 0:
+            return result
+
+        # the expanded key holds the key schedules as they are after block 0
+        offsets = (np.arange(first_block, first_block + count) - 1) * 16
+        subkey = np.tile(np.frombuffer(self.key, dtype=np.uint8), (count, 1))
+        subkeys = []
+        for key_schedule in self.load_key_schedules(expanded_key):
+            subkey = EnigmaBytesBatch.from_offsets(key_schedule, offsets).encrypt(subkey)
+            subkeys.append(subkey)
+
+        # (count, 16) subkeys, each as its high and low 64 bits
+        halves = np.stack(subkeys, axis=1).view('>u8').reshape(count, 16, 2).tolist()
+        result.extend([(high << 64) | low for high, low in block] for block in halves)
+        return result
+
+    def encrypt_block_int(self, block: int, subkeys: List[int]) -> int:
+        left, right = block >> 64, block & MASK_64
+        for subkey in subkeys:
+            left, right = right, left ^ self.round_function_int(right, subkey)
+        return (left << 64) | right
+
+    def decrypt_block_int(self, block: int, subkeys: List[int]) -> int:
+        left, right = block >> 64, block & MASK_64
+        for subkey in reversed(subkeys):
+            left, right = right ^ self.round_function_int(left, subkey), left
+        return (left << 64) | right
+
+    def ctr_transform(self, data: bytes, first_block: int = 0) -> bytes:
+        """
+        XOR data with the keystream starting at block first_block.
+        Counter block i is nonce || i, encrypted with the first block's subkeys.
+        """
+        subkeys = self.expanded_key.subkeys
+        blocks = (len(data) + 15) // 16
+        if blocks >= BATCH_MIN_BLOCKS:
+            from .block_cipher_batch import BlockCipherBatch
+            return BlockCipherBatch(subkeys).ctr_transform(self.nonce, first_block, data)
+
+        nonce = int.from_bytes(self.nonce, byteorder='big') << 64
+
+        result = bytearray(len(data))
+        counter = first_block
+        for index in range(0, len(data), 16):
+            chunk = data[index : index + 16]
+            keystream = self.encrypt_block_int(nonce | (counter & MASK_64), subkeys)
+            if len(chunk) < 16:
+                keystream >>= 8 * (16 - len(chunk))
+            block = int.from_bytes(chunk, byteorder='big') ^ keystream
+            result[index : index + len(chunk)] = block.to_bytes(len(chunk), byteorder='big')
+            counter += 1
 
-        shifts = [1,1,2,2,2,2,2,2,1,2,2,2,2,2,2,1]
+        return bytes(result)
 
-        block_counts = len(plaintext) // 16
+    def ctr(self, data: bytes) -> bytes:
+        if self.workers <= 1 or len(data) <= PARALLEL_CHUNK_SIZE:
+            return self.ctr_transform(data)
+
+        starts = range(0, len(data), PARALLEL_CHUNK_SIZE)
+        chunks = [bytes(data[start : start + PARALLEL_CHUNK_SIZE]) for start in starts]
+        count = len(chunks)
+
+        executor = shared_process_pool(self.workers)
+        results = executor.map(
+            _ctr_chunk,
+            [self.key] * count,
+            [self.nonce] * count,
+            [self.expanded_key] * count,
+            [start // 16 for start in starts],
+            chunks,
+        )
+        return b''.join(results)
 
-        result = bytearray()
-        key_schedules = []
+    def encrypt(self, plaintext: bytes) -> bytes:
+        if self.mode == BlockCipherMode.CTR:
+            return self.ctr(plaintext)
 
-        for block in range(block_counts):
-            index = block * 16
+        # The last block is padded with zeros to 16 bytes (128 bits)
+        plaintext = memoryview(plaintext)
+        length = (len(plaintext) + 15) // 16 * 16
 
-            left = plaintext[index : index + 8]
-            right = plaintext[index + 8: index + 16]
-            block_plaintext = left + right
-            if len(result) == 0:
-                block_plaintext = byte_xor(block_plaintext, self.IV)
-            else:
-                block_plaintext = byte_xor(block_plaintext, result[(block-1)*16:block*16])
-            left, right = block_plaintext[0:8], block_plaintext[8:16]
-
-            subkey = self.key
-            for i in range(16):
-                if i < len(key_schedules):
-                    key_schedule = key_schedules[i]
-                else:
-                    key_schedule =  self.build_key_schedule(subkey, shifts[i])
-                    key_schedules.append(key_schedule)
-
-                subkey = key_schedule.encrypt(subkey)
-                left, right = self.feistel_network_for_encrypt(left, right, subkey)
-            
-            result.extend(left + right)
+        result = bytearray(length)
+
+        previous = int.from_bytes(self.IV, byteorder='big')
+        for index, subkeys in zip(range(0, length, 16), self.iter_subkeys(0, length // 16)):
+            chunk = plaintext[index : index + 16]
+            block = int.from_bytes(chunk, byteorder='big') << (8 * (16 - len(chunk)))
+            previous = self.encrypt_block_int(block ^ previous, subkeys)
+            result[index : index + 16] = previous.to_bytes(16, byteorder='big')
 
         return bytes(result)
 
     def decrypt(self, ciphertext: bytes) -> bytes:
-        shifts = [1,1,2,2,2,2,2,2,1,2,2,2,2,2,2,1]
+        if self.mode == BlockCipherMode.CTR:
+            return self.ctr(ciphertext)
+
+        ciphertext = memoryview(ciphertext)
+        length = len(ciphertext) // 16 * 16
+        if self.workers <= 1 or length <= PARALLEL_CHUNK_SIZE:
+            return self.cbc_decrypt_range(ciphertext[:length], 0, self.IV)
+
+        # each chunk only needs the ciphertext block in front of it
+        starts = range(0, length, PARALLEL_CHUNK_SIZE)
+        chunks = [bytes(ciphertext[start : min(start + PARALLEL_CHUNK_SIZE, length)]) for start in starts]
+        previous = [self.IV if start == 0 else bytes(ciphertext[start - 16 : start]) for start in starts]
+        count = len(chunks)
+
+        executor = shared_process_pool(self.workers)
+        results = executor.map(
+            _cbc_decrypt_chunk,
+            [self.key] * count,
+            [self.expanded_key] * count,
+            [start // 16 for start in starts],
+            previous,
+            chunks,
+        )
+        return b''.join(results)
 
+    def cbc_decrypt_range(self, ciphertext: bytes, first_block: int, previous: bytes) -> bytes:
+        """
+        Decrypt whole blocks starting at block index first_block,
+        previous is the ciphertext block before them (IV for block 0)
+        """
         block_counts = len(ciphertext) // 16
 
-        result = bytearray()
-        key_schedules = []
-
-        prevs = []
-
-        for block in range(block_counts):
-            index = block * 16
+        result = bytearray(block_counts * 16)
 
-            left = ciphertext[index : index + 8]
-            right = ciphertext[index + 8: index + 16]
+        previous = int.from_bytes(previous, byteorder='big')
+        for index, subkeys in zip(range(0, block_counts * 16, 16), self.iter_subkeys(first_block, block_counts)):
+            block = int.from_bytes(ciphertext[index : index + 16], byteorder='big')
+            plain = self.decrypt_block_int(block, subkeys) ^ previous
+            result[index : index + 16] = plain.to_bytes(16, byteorder='big')
+            previous = block
 
-            subkeys = []
-            subkey = self.key
-            for i in range(16):
-                if i < len(key_schedules):
-                    key_schedule = key_schedules[i]
-                else:
-                    key_schedule = self.build_key_schedule(subkey, shifts[i])
-                    key_schedules.append(key_schedule)
-
-                subkey = key_schedule.encrypt(subkey)
-                subkeys.append(subkey)
+        return bytes(result)
 
-            prevs.append(left + right)
-            for i in reversed(range(16)):
-                left, right = self.feistel_network_for_decrypt(left, right, subkeys[i])
-            
-            if len(result) == 0:
-                result.extend(byte_xor(left + right, bytes([self.IV]) if isinstance(self.IV, int) else self.IV))
+    def encryptor(self) -> 'BlockCipherStream':
+        return BlockCipherStream(self, decrypt=False)
+
+    def decryptor(self) -> 'BlockCipherStream':
+        return BlockCipherStream(self, decrypt=True)
+
+class BlockCipherStream():
+    '''
+    Incremental encryption or decryption with the same output as
+    BlockCipher.encrypt / BlockCipher.decrypt on the concatenated input.
+    Only the partial last block, the chaining block and the key schedules
+    are kept between update calls.
+    '''
+    def __init__(self, cipher: BlockCipher, decrypt: bool = False) -> None:
+        self.cipher = cipher
+        self.decrypt = decrypt
+
+        self._buffer = b''
+        self._block = 0
+        self._previous = int.from_bytes(cipher.IV, byteorder='big')
+        self._subkeys = cipher.iter_subkeys() if cipher.mode == BlockCipherMode.CBC else None
+        self._finalized = False
+
+    def update(self, chunk: bytes) -> bytes:
+        if self._finalized:
+            raise ValueError('stream is already finalized')
+
+        data = self._buffer + chunk if self._buffer else chunk
+        length = len(data) // 16 * 16
+        self._buffer = bytes(data[length:])
+        return self._process(data[:length])
+
+    def finalize(self) -> bytes:
+        if self._finalized:
+            raise ValueError('stream is already finalized')
+        self._finalized = True
+
+        data, self._buffer = self._buffer, b''
+        if not data:
+            return b''
+
+        if self.cipher.mode == BlockCipherMode.CTR:
+            return self._process(data)
+
+        # CBC decryption ignores a trailing partial block, encryption pads it with zeros
+        if self.decrypt:
+            return b''
+        return self._process(data + b'\x00' * (16 - len(data)))
+
+    def _process(self, data: bytes) -> bytes:
+        if not data:
+            return b''
+
+        cipher = self.cipher
+        if cipher.mode == BlockCipherMode.CTR:
+            result = cipher.ctr_transform(data, self._block)
+            self._block += (len(data) + 15) // 16
+            return result
+
+        result = bytearray(len(data))
+        previous = self._previous
+        for index in range(0, len(data), 16):
+            block = int.from_bytes(data[index : index + 16], byteorder='big')
+            subkeys = next(self._subkeys)
+            if self.decrypt:
+                output = cipher.decrypt_block_int(block, subkeys) ^ previous
+                previous = block
             else:
-                result.extend(byte_xor(left + right, prevs[block-1]))
+                output = previous = cipher.encrypt_block_int(block ^ previous, subkeys)
+            result[index : index + 16] = output.to_bytes(16, byteorder='big')
 
+        self._previous = previous
+        self._block += len(data) // 16
         return bytes(result)
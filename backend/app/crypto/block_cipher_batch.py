@@ -0,0 +1,111 @@
+'''
+    Vectorised BlockCipher rounds
+
+    Runs the Feistel network of BlockCipher on N independent blocks at once,
+    held as (N, 16) uint8 arrays and processed as two uint64 halves. Used
+    for CTR keystreams and other batches of blocks under one key.
+
+    The S-box indices of a round only depend on 6 bits of every 2-byte block
+    of expansion(R) ^ subkey, and are linear (over XOR) in both. So the
+    expansion and the index selection of BlockCipher.round_function_int are
+    folded into one table per input byte, giving the 8 packed S-box indices
+    of the round directly, and every subkey is reduced to the same 8 indices.
+'''
+from typing import Sequence, Union
+import numpy as np
+from .block_cipher import BlockCipher, EXPANSION, SBOX_TABLES, SBOX_ROW_MASK, SBOX_COL_MASK, MASK_64
+
+def _sbox_indices(value: int) -> int:
+    '''
+    Pack the 8 S-box indices (row << 7 | col) selected by a 128-bit S-box input
+    '''
+    high = value >> 8
+    index = ((high ^ value) & SBOX_ROW_MASK) | (high & SBOX_COL_MASK)
+
+    packed = 0
+    for i in range(8):
+        packed = (packed << 8) | ((index >> (112 - 16 * i)) & 0xFF)
+    return packed
+
+# (8, 256) packed S-box indices contributed by every value of input byte j
+INDEX_TABLES = np.array([[_sbox_indices(value) for value in table] for table in EXPANSION.tables], dtype=np.uint64)
+
+# (8, 256) S-box outputs already shifted into place in the 64-bit round output
+SBOX_ARRAY = np.array(SBOX_TABLES, dtype=np.uint64)
+
+def subkeys_to_array(subkeys: Sequence[int]) -> np.ndarray:
+    '''
+    (16,) uint64 array of the packed S-box indices every subkey XORs in
+    '''
+    return np.array([_sbox_indices(subkey) for subkey in subkeys], dtype=np.uint64)
+
+def blocks_to_array(data: bytes) -> np.ndarray:
+    if len(data) % 16 != 0:
+        raise ValueError('data length must be a multiple of 16 bytes')
+    return np.frombuffer(data, dtype=np.uint8).reshape(-1, 16)
+
+def _byte_columns(values: np.ndarray) -> np.ndarray:
+    # (8, N) most significant byte first, each row contiguous
+    return np.ascontiguousarray(values.astype('>u8').view(np.uint8).reshape(-1, 8).T)
+
+class BlockCipherBatch():
+    '''
+    Batched block cipher
+    Arguments:
+        subkeys: 16 round subkeys as integers, or an array from
+            subkeys_to_array, (16,) shared by every block or (N, 16) per block
+    '''
+    def __init__(self, subkeys: Union[Sequence[int], np.ndarray]) -> None:
+        if not isinstance(subkeys, np.ndarray):
+            subkeys = subkeys_to_array(subkeys)
+        if subkeys.shape[-1] != 16:
+            raise ValueError('subkeys must have shape (16,) or (N, 16)')
+
+        self.subkeys = subkeys.astype(np.uint64, copy=False)
+
+    @classmethod
+    def from_cipher(cls, cipher: BlockCipher) -> 'BlockCipherBatch':
+        return cls(cipher.expanded_key.subkeys)
+
+    def round_function(self, data: np.ndarray, subkey: np.ndarray) -> np.ndarray:
+        data_bytes = _byte_columns(data)
+        index = INDEX_TABLES[0][data_bytes[0]]
+        for j in range(1, 8):
+            index ^= INDEX_TABLES[j][data_bytes[j]]
+        index ^= subkey
+
+        index_bytes = _byte_columns(index)
+        result = SBOX_ARRAY[0][index_bytes[0]]
+        for k in range(1, 8):
+            result |= SBOX_ARRAY[k][index_bytes[k]]
+        return result
+
+    def encrypt_blocks(self, blocks: np.ndarray) -> np.ndarray:
+        return self._join(*self._encrypt_halves(*self._split(blocks)))
+
+    def decrypt_blocks(self, blocks: np.ndarray) -> np.ndarray:
+        left, right = self._split(blocks)
+        for i in reversed(range(16)):
+            left, right = right ^ self.round_function(left, self.subkeys[..., i]), left
+        return self._join(left, right)
+
+    def ctr_keystream(self, nonce: bytes, first_block: int, count: int) -> np.ndarray:
+        counters = np.arange(count, dtype=np.uint64) + np.uint64(first_block & MASK_64)
+        left = np.full(count, int.from_bytes(nonce, byteorder='big'), dtype=np.uint64)
+        return self._join(*self._encrypt_halves(left, counters))
+
+    def ctr_transform(self, nonce: bytes, first_block: int, data: bytes) -> bytes:
+        keystream = self.ctr_keystream(nonce, first_block, (len(data) + 15) // 16)
+        return (np.frombuffer(data, dtype=np.uint8) ^ keystream.reshape(-1)[:len(data)]).tobytes()
+
+    def _encrypt_halves(self, left: np.ndarray, right: np.ndarray):
+        for i in range(16):
+            left, right = right, left ^ self.round_function(right, self.subkeys[..., i])
+        return left, right
+
+    def _split(self, blocks: np.ndarray):
+        halves = np.ascontiguousarray(blocks, dtype=np.uint8).view('>u8').astype(np.uint64)
+        return halves[:, 0], halves[:, 1]
+
+    def _join(self, left: np.ndarray, right: np.ndarray) -> np.ndarray:
+        return np.stack((left, right), axis=1).astype('>u8').view(np.uint8).reshape(-1, 16)
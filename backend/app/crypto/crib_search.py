@@ -0,0 +1,273 @@
+'''
+    Known-plaintext (crib) search for EnigmaMachine and EnigmaBytesMachine
+
+    Tries a crib at a range of offsets of a ciphertext against rotor orders,
+    middle and right rings and start positions, assuming an empty plugboard.
+    The left ring is fixed at 0: the left rotor never turns another rotor,
+    so only its position - ring matters and every left position is tried.
+
+    Offsets where the crib would encrypt a letter to itself are dropped up
+    front, since the reflector has no fixed points. For every other setting
+    of the middle and right rotors the rotor states under the crib are
+    stepped once, and a table over all left rotor shifts gives the left
+    positions that fit the first crib letters, so most settings are ruled
+    out without being tried one by one.
+'''
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from enum import Enum
+from functools import lru_cache
+from itertools import permutations, product
+from typing import Callable, List, NamedTuple, Optional, Sequence, Tuple, Union
+import threading
+import time
+
+from . import enigma, enigma_bytes
+
+class CribMachine(Enum):
+    ENIGMA = 'enigma'
+    ENIGMA_BYTES = 'enigma_bytes'
+
+class CribCandidate(NamedTuple):
+    matches: int
+    offset: int
+    rotors: tuple
+    rings: Tuple[int, int, int]
+    positions: Tuple[int, int, int]
+
+class CribProgress(NamedTuple):
+    tasks_done: int
+    tasks_total: int
+    candidates_tested: int
+    elapsed: float
+
+class _Wiring(NamedTuple):
+    size: int
+    compile_rotor: Callable
+    compile_slow_rotors: Callable
+    notch: Callable
+    positions_at: Callable
+
+def _wiring(machine: CribMachine) -> _Wiring:
+    if machine == CribMachine.ENIGMA:
+        return _Wiring(
+            enigma.LETTER_COUNT,
+            enigma.compile_rotor,
+            enigma.compile_slow_rotors,
+            enigma.notch_index,
+            enigma.rotor_positions_at,
+        )
+    return _Wiring(
+        256,
+        enigma_bytes.compile_rotor,
+        # uncached, a search needs every slow rotor state once
+        enigma_bytes.compile_slow_rotors.__wrapped__,
+        enigma_bytes.EnigmaBytesRotor.get_turnover_notch,
+        enigma_bytes.rotor_positions_at,
+    )
+
+@lru_cache(maxsize=4)
+def _slow_columns(machine: CribMachine, left, middle) -> List[List[bytes]]:
+    '''
+    columns[middle_shift][letter][left_shift] = output of the slow rotors
+    for letter, so one bytes.find gives every left shift mapping letter to a target
+    '''
+    wiring = _wiring(machine)
+    size = wiring.size
+    tables = [
+        [wiring.compile_slow_rotors(left, middle, left_shift, middle_shift) for middle_shift in range(size)]
+        for left_shift in range(size)
+    ]
+    return [
+        [bytes(tables[left_shift][middle_shift][letter] for left_shift in range(size)) for letter in range(size)]
+        for middle_shift in range(size)
+    ]
+
+def _search_task(machine: CribMachine, cipher_text: bytes, crib: bytes, offsets: Sequence[int], rotors: tuple,
+                 middle_ring: int, right_ring: int, middle_positions: Sequence[int], right_positions: Sequence[int],
+                 max_mismatches: int) -> Tuple[int, List[CribCandidate]]:
+    wiring = _wiring(machine)
+    size = wiring.size
+    columns = _slow_columns(machine, rotors[0], rotors[1])
+    right_forward = wiring.compile_rotor(rotors[2])[0]
+    middle_notch = wiring.notch(rotors[1])
+    right_notch = wiring.notch(rotors[2])
+    # a setting within max_mismatches matches at least one of these crib letters
+    anchors = range(min(max_mismatches + 1, len(crib)))
+
+    tested = 0
+    found = []
+    for middle_position, right_position, offset in product(middle_positions, right_positions, offsets):
+        tested += size
+
+        # rotor states under the crib, with the left rotor counted from 0
+        left, middle, right = wiring.positions_at(rotors, [0, middle_position, right_position], offset)
+        steps = []
+        for _ in crib:
+            if middle == middle_notch:
+                middle = (middle + 1) % size
+                left = (left + 1) % size
+            if right == right_notch:
+                middle = (middle + 1) % size
+            right = (right + 1) % size
+
+            # the right rotor maps both ends of the slow rotors, so compare there
+            forward = right_forward[(right - right_ring) % size]
+            steps.append((left, columns[(middle - middle_ring) % size], forward))
+
+        candidates = set()
+        for i in anchors:
+            left_steps, column, forward = steps[i]
+            shifts = column[forward[crib[i]]]
+            target = forward[cipher_text[offset + i]]
+            shift = shifts.find(target)
+            while shift != -1:
+                candidates.add((shift - left_steps) % size)
+                shift = shifts.find(target, shift + 1)
+
+        for left_position in candidates:
+            mismatches = 0
+            for i, (left_steps, column, forward) in enumerate(steps):
+                if column[forward[crib[i]]][(left_position + left_steps) % size] != forward[cipher_text[offset + i]]:
+                    mismatches += 1
+                    if mismatches > max_mismatches:
+                        break
+            else:
+                found.append(CribCandidate(
+                    len(crib) - mismatches,
+                    offset,
+                    rotors,
+                    (0, middle_ring, right_ring),
+                    (left_position, middle_position, right_position),
+                ))
+
+    return tested, found
+
+class CribSearch():
+    '''
+    Crib search constructor
+    Arguments:
+        cipher_text: letters A-Z for CribMachine.ENIGMA, bytes for CribMachine.ENIGMA_BYTES
+        crib: known plaintext somewhere in cipher_text
+        offsets: offsets of cipher_text to try the crib at, every offset it fits by default
+        machine: which Enigma produced cipher_text
+        rotor_orders: rotor orders (left to right) to try, all of them by default
+        middle_rings, right_rings, middle_positions, right_positions: values to try, all by default
+        max_mismatches: crib letters a setting may get wrong and still be reported
+        workers: processes to spread the search over
+    '''
+    def __init__(self, cipher_text: Union[str, bytes], crib: Union[str, bytes], offsets: Optional[Sequence[int]] = None,
+                 machine: CribMachine = CribMachine.ENIGMA, rotor_orders: Optional[Sequence[tuple]] = None,
+                 middle_rings: Optional[Sequence[int]] = None, right_rings: Optional[Sequence[int]] = None,
+                 middle_positions: Optional[Sequence[int]] = None, right_positions: Optional[Sequence[int]] = None,
+                 max_mismatches: int = 0, workers: int = 1) -> None:
+        self.machine = machine
+        self.cipher_text = self._letters(cipher_text)
+        self.crib = self._letters(crib)
+        if not self.crib or len(self.crib) > len(self.cipher_text):
+            raise ValueError('crib must be non-empty and no longer than the cipher text')
+        if max_mismatches < 0:
+            raise ValueError('max_mismatches must not be negative')
+
+        size = _wiring(machine).size
+        if offsets is None:
+            offsets = range(len(self.cipher_text) - len(self.crib) + 1)
+        if any(offset < 0 or offset + len(self.crib) > len(self.cipher_text) for offset in offsets):
+            raise ValueError('crib does not fit the cipher text at every offset')
+
+        self.offsets = [offset for offset in offsets if self._fits(offset, max_mismatches)]
+        self.rotor_orders = [tuple(rotors) for rotors in rotor_orders] if rotor_orders is not None else self._rotor_orders()
+        self.middle_rings = list(middle_rings if middle_rings is not None else range(size))
+        self.right_rings = list(right_rings if right_rings is not None else range(size))
+        self.middle_positions = list(middle_positions if middle_positions is not None else range(size))
+        self.right_positions = list(right_positions if right_positions is not None else range(size))
+        self.max_mismatches = max_mismatches
+        self.workers = workers
+
+        self.cancelled = False
+        self._cancel = threading.Event()
+
+    def _letters(self, text: Union[str, bytes]) -> bytes:
+        if self.machine == CribMachine.ENIGMA_BYTES:
+            return bytes(text)
+
+        letters = text.encode('ascii')
+        if letters.translate(None, enigma.ALPHABET_BYTES):
+            raise ValueError('cipher text and crib must only contain the letters A-Z')
+        return letters.translate(enigma.TO_INDEX)
+
+    def _fits(self, offset: int, max_mismatches: int) -> bool:
+        # the reflector has no fixed points, so no letter encrypts to itself
+        same = sum(self.crib[i] == self.cipher_text[offset + i] for i in range(len(self.crib)))
+        return same <= max_mismatches
+
+    def _rotor_orders(self) -> List[tuple]:
+        if self.machine == CribMachine.ENIGMA_BYTES:
+            return list(product(enigma_bytes.EnigmaBytesRotor, repeat=3))
+        return list(permutations(enigma.EnigmaRotor, 3))
+
+    def _tasks(self) -> List[tuple]:
+        return [
+            (self.machine, self.cipher_text, self.crib, self.offsets, rotors, middle_ring, right_ring,
+             self.middle_positions, self.right_positions, self.max_mismatches)
+            for rotors, middle_ring, right_ring in product(self.rotor_orders, self.middle_rings, self.right_rings)
+        ]
+
+    @property
+    def candidate_count(self) -> int:
+        size = _wiring(self.machine).size
+        return (
+            len(self.offsets) * len(self.rotor_orders) * len(self.middle_rings) * len(self.right_rings)
+            * len(self.middle_positions) * len(self.right_positions) * size
+        )
+
+    def cancel(self) -> None:
+        '''
+        Stop the search, run returns the candidates found so far
+        '''
+        self._cancel.set()
+
+    def run(self, progress: Optional[Callable[[CribProgress], None]] = None, top: Optional[int] = None) -> List[CribCandidate]:
+        '''
+        Search, calling progress after every finished task, and return the
+        candidates ranked by matching crib letters, then offset
+        '''
+        tasks = self._tasks() if self.offsets else []
+        start = time.perf_counter()
+        done = 0
+        tested = 0
+        found = []
+
+        def finished(result: Tuple[int, List[CribCandidate]]) -> None:
+            nonlocal done, tested
+            done += 1
+            tested += result[0]
+            found.extend(result[1])
+            if progress is not None:
+                progress(CribProgress(done, len(tasks), tested, time.perf_counter() - start))
+
+        if self.workers <= 1:
+            for task in tasks:
+                if self._cancel.is_set():
+                    break
+                finished(_search_task(*task))
+        else:
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                # only a few tasks are queued ahead, so cancel takes effect quickly
+                pending = set()
+                queue = iter(tasks)
+                while True:
+                    while not self._cancel.is_set() and len(pending) < 2 * self.workers:
+                        task = next(queue, None)
+                        if task is None:
+                            break
+                        pending.add(executor.submit(_search_task, *task))
+                    if not pending:
+                        break
+
+                    completed, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in completed:
+                        finished(future.result())
+
+        self.cancelled = self._cancel.is_set() and done < len(tasks)
+        found.sort(key=lambda candidate: (-candidate.matches, candidate.offset))
+        return found if top is None else found[:top]
@@ -1,7 +1,10 @@
-from typing import NamedTuple, Optional
+from functools import lru_cache
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+import os
 import secrets
 import hashlib
 import random
+from .lru_cache import LRUCache
 
 class Point(NamedTuple):
     x: int
@@ -10,6 +13,12 @@ class Point(NamedTuple):
     def __eq__(self, other: 'Point'):
         return self.x == other.x and self.y == other.y
 
+class JacobianPoint(NamedTuple):
+    # affine (X / Z², Y / Z³), the point at infinity has Z = 0
+    x: int
+    y: int
+    z: int
+
 class Signature(NamedTuple):
     r: int
     s: int
@@ -74,24 +83,278 @@ def add(point1: Point, point2: Point) -> Point:
     # Return the new point
     return Point(x,y)
 
+# --------------------
+# Jacobian coordinates: no inverse per operation, formulas specialised for a = 0
+# reference: https://hyperelliptic.org/EFD/g1p/auto-shortw-jacobian-0.html
+# --------------------
+INFINITY = JacobianPoint(1, 1, 0)
+
+def to_jacobian(point: Point) -> JacobianPoint:
+    return JacobianPoint(point.x, point.y, 1)
+
+def to_affine(point: JacobianPoint) -> Point:
+    if point.z == 0:
+        raise ValueError('point at infinity has no affine coordinates')
+    z_inv = inverse(point.z, p)
+    z_inv2 = (z_inv * z_inv) % p
+    return Point((point.x * z_inv2) % p, (point.y * z_inv2 * z_inv) % p)
+
+def jacobian_double(point: JacobianPoint) -> JacobianPoint:
+    # dbl-2009-l
+    x1, y1, z1 = point
+    if z1 == 0 or y1 == 0:
+        return INFINITY
+
+    xx = (x1 * x1) % p
+    yy = (y1 * y1) % p
+    yyyy = (yy * yy) % p
+    d = (2 * ((x1 + yy) ** 2 - xx - yyyy)) % p
+    e = 3 * xx
+    x3 = (e * e - 2 * d) % p
+    y3 = (e * (d - x3) - 8 * yyyy) % p
+    z3 = (2 * y1 * z1) % p
+    return JacobianPoint(x3, y3, z3)
+
+def jacobian_add(point1: JacobianPoint, point2: JacobianPoint) -> JacobianPoint:
+    # add-2007-bl without the squaring tricks
+    x1, y1, z1 = point1
+    x2, y2, z2 = point2
+    if z1 == 0:
+        return point2
+    if z2 == 0:
+        return point1
+
+    z1z1 = (z1 * z1) % p
+    z2z2 = (z2 * z2) % p
+    u1 = (x1 * z2z2) % p
+    u2 = (x2 * z1z1) % p
+    s1 = (y1 * z2 * z2z2) % p
+    s2 = (y2 * z1 * z1z1) % p
+    h = (u2 - u1) % p
+    r = (s2 - s1) % p
+    if h == 0:
+        return jacobian_double(point1) if r == 0 else INFINITY
+
+    hh = (h * h) % p
+    hhh = (h * hh) % p
+    v = (u1 * hh) % p
+    x3 = (r * r - hhh - 2 * v) % p
+    y3 = (r * (v - x3) - s1 * hhh) % p
+    z3 = (z1 * z2 * h) % p
+    return JacobianPoint(x3, y3, z3)
+
+def jacobian_add_affine(point1: JacobianPoint, point2: Point) -> JacobianPoint:
+    # mixed addition, madd-2007-bl with Z2 = 1
+    x1, y1, z1 = point1
+    x2, y2 = point2
+    if z1 == 0:
+        return to_jacobian(point2)
+
+    z1z1 = (z1 * z1) % p
+    u2 = (x2 * z1z1) % p
+    s2 = (y2 * z1 * z1z1) % p
+    h = (u2 - x1) % p
+    r = (s2 - y1) % p
+    if h == 0:
+        return jacobian_double(point1) if r == 0 else INFINITY
+
+    hh = (h * h) % p
+    hhh = (h * hh) % p
+    v = (x1 * hh) % p
+    x3 = (r * r - hhh - 2 * v) % p
+    y3 = (r * (v - x3) - y1 * hhh) % p
+    z3 = (z1 * h) % p
+    return JacobianPoint(x3, y3, z3)
+
+def jacobian_multiply(k: int, point: Point) -> JacobianPoint:
+    current = INFINITY
+    for i in reversed(range(k.bit_length())):
+        current = jacobian_double(current)
+        if (k >> i) & 1:
+            current = jacobian_add_affine(current, point)
+    return current
+
+def to_affine_many(points: List[JacobianPoint]) -> List[Point]:
+    """
+    to_affine of every (finite) point, sharing one inverse between them
+    """
+    # prefix[i] = z₀ * ... * zᵢ₋₁
+    prefix = [1]
+    for point in points:
+        prefix.append((prefix[-1] * point.z) % p)
+
+    result = [None] * len(points)
+    acc_inv = inverse(prefix[-1], p)
+    for i in reversed(range(len(points))):
+        z_inv = (acc_inv * prefix[i]) % p
+        acc_inv = (acc_inv * points[i].z) % p
+        z_inv2 = (z_inv * z_inv) % p
+        result[i] = Point((points[i].x * z_inv2) % p, (points[i].y * z_inv2 * z_inv) % p)
+    return result
+
+# ----------------
+# Fixed-base table: k·P as one mixed addition per window of k, no doublings
+# ----------------
+class FixedBaseTable():
+    """
+    Multiples of a fixed point for every window of a scalar
+    Arguments:
+        point: the fixed base point
+        window: bits per window, the table holds ceil(256 / window) rows
+            of 2^window - 1 affine points
+    """
+    def __init__(self, point: Point, window: int) -> None:
+        if window < 1:
+            raise ValueError('window must be at least 1')
+
+        self.point = point
+        self.window = window
+        self.rows = -(-n.bit_length() // window)
+
+        # row i holds j·2^(window·i)·point for j = 1 .. 2^window - 1
+        points = []
+        base = to_jacobian(point)
+        for _ in range(self.rows):
+            multiple = base
+            for _ in range((1 << window) - 1):
+                points.append(multiple)
+                multiple = jacobian_add(multiple, base)
+            base = multiple
+
+        affine = to_affine_many(points)
+        size = (1 << window) - 1
+        self.table = [affine[row * size:(row + 1) * size] for row in range(self.rows)]
+
+    def __len__(self) -> int:
+        return self.rows * ((1 << self.window) - 1)
+
+    def multiply(self, k: int) -> JacobianPoint:
+        k %= n
+        window, mask = self.window, (1 << self.window) - 1
+
+        current = INFINITY
+        for row in self.table:
+            digit = k & mask
+            if digit:
+                current = jacobian_add_affine(current, row[digit - 1])
+            k >>= window
+        return current
+
+# window of the generator table, 0 multiplies G by double-and-add instead
+GENERATOR_WINDOW = int(os.environ.get('EC_GENERATOR_WINDOW', 6))
+
+@lru_cache(maxsize=None)
+def generator_table(window: int) -> FixedBaseTable:
+    """
+    FixedBaseTable of G, built the first time a window size is used
+    """
+    return FixedBaseTable(G, window)
+
+def generator_multiply(k: int) -> JacobianPoint:
+    if GENERATOR_WINDOW <= 0:
+        return jacobian_multiply(k, G)
+    return generator_table(GENERATOR_WINDOW).multiply(k)
+
+# ----
+# wNAF: signed odd digits, at most one non-zero digit in any width consecutive ones
+# ----
+# wNAF widths of the G table, of one-off points and of cached public keys
+GENERATOR_WNAF_WIDTH = 8
+POINT_WNAF_WIDTH = 5
+PUBLIC_KEY_WNAF_WIDTH = 6
+
+def is_on_curve(point: Point) -> bool:
+    return 0 <= point.x < p and 0 <= point.y < p and (point.y ** 2 - point.x ** 3 - a * point.x - b) % p == 0
+
+def wnaf(k: int, width: int) -> List[int]:
+    """
+    Width-w NAF digits of k, least significant first
+    """
+    digits = []
+    while k:
+        digit = 0
+        if k & 1:
+            digit = k & ((1 << width) - 1)
+            if digit >= 1 << (width - 1):
+                digit -= 1 << width
+            k -= digit
+        digits.append(digit)
+        k >>= 1
+    return digits
+
+def odd_multiples(point: Point, width: int) -> List[Point]:
+    """
+    point, 3·point, 5·point, ..., (2^(width-1) - 1)·point, for wNAF digits
+    """
+    twice = jacobian_double(to_jacobian(point))
+    multiples = [to_jacobian(point)]
+    for _ in range((1 << (width - 2)) - 1):
+        multiples.append(jacobian_add(multiples[-1], twice))
+    return to_affine_many(multiples)
+
+@lru_cache(maxsize=None)
+def generator_odd_multiples(width: int) -> List[Point]:
+    return odd_multiples(G, width)
+
+def multi_multiply(terms: Sequence[Tuple[int, Sequence[Point]]]) -> JacobianPoint:
+    """
+    Σ kᵢ·Pᵢ for (kᵢ, odd_multiples(Pᵢ, wᵢ)) terms, interleaving the wNAF
+    digits of every scalar so all of them share one chain of doublings
+    """
+    nafs = [(wnaf(k % n, len(table).bit_length() + 1), table) for k, table in terms]
+    length = max((len(digits) for digits, _ in nafs), default=0)
+
+    current = INFINITY
+    for i in reversed(range(length)):
+        current = jacobian_double(current)
+        for digits, table in nafs:
+            digit = digits[i] if i < len(digits) else 0
+            if digit > 0:
+                current = jacobian_add_affine(current, table[digit >> 1])
+            elif digit < 0:
+                x, y = table[-digit >> 1]
+                current = jacobian_add_affine(current, Point(x, p - y))
+    return current
+
+def wnaf_multiply(k: int, point: Point, table: Optional[Sequence[Point]] = None) -> JacobianPoint:
+    """
+    k·point from its wNAF digits, table is odd_multiples(point, w) if already known
+    """
+    if table is None:
+        table = odd_multiples(point, POINT_WNAF_WIDTH)
+    return multi_multiply([(k, table)])
+
 # --------
 # Multiply: use double and add operations to quickly multiply a point by an integer value (i.e. a private key)
 # --------
 def multiply(k: int, point: Optional[Point] = None) -> Point:
-    if point is None:
-        point = Point(G.x, G.y)
-    # create a copy the initial starting point (for use in addition later on)
-    current = Point(point.x, point.y)
-
-    # convert to binary string and remove '0b' prefix
-    binary = bin(k)[2:]
-
-    # double and add algorithm for fast multiplication
-    for char in binary[1:]:
-        current = double(current)
-        if char == '1':
-            current = add(current, point)
-    return current
+    if point is None or point == G:
+        return to_affine(generator_multiply(k))
+
+    # wNAF double and add in Jacobian coordinates, a single inverse at the end
+    return to_affine(wnaf_multiply(k, point))
+
+# -----------
+# Public keys: parsed points and their wNAF tables, shared by repeated verifies
+# -----------
+class PublicKey(NamedTuple):
+    point: Point
+    odd_multiples: Tuple[Point, ...]
+
+# Public keys keyed by their uncompressed hex string, None for keys not on the curve
+PUBLIC_KEY_CACHE = LRUCache(
+    maxsize=int(os.environ.get('EC_PUBLIC_KEY_CACHE_SIZE', 4096)),
+    ttl=None,
+)
+
+def parse_public_key(public_key: str) -> Optional[PublicKey]:
+    point = Point(int(public_key[2:2+64], 16), int(public_key[2+64:2+64*2], 16))
+    if not is_on_curve(point):
+        return None
+    return PublicKey(point, tuple(odd_multiples(point, PUBLIC_KEY_WNAF_WIDTH)))
+
+def load_public_key(public_key: str) -> Optional[PublicKey]:
+    return PUBLIC_KEY_CACHE.get_or_create(public_key, lambda: parse_public_key(public_key))
 
 # ----
 # Sign
@@ -117,19 +380,22 @@ def sign(private_key: int, hash_digest: int, nonce: Optional[int]=None) -> Signa
 # Verify
 # ------
 def verify(public_key: str, signature: Signature, hash_digest: int):
-    public_key_point = Point(int(public_key[2:2+64], 16), int(public_key[2+64:2+64*2], 16))
-
-    # point 1
-    point1 = multiply(inverse(signature.s, n) * hash_digest)
+    key = load_public_key(public_key)
+    if key is None:
+        return False
 
-    # point 2
-    point2 = multiply((inverse(signature.s, n) * signature.r), public_key_point)
+    s_inv = inverse(signature.s, n)
 
-    # add two points together
-    point3 = add(point1, point2)
+    # point 1 + point 2 = u1·G + u2·Q in one pass (Strauss-Shamir), G's odd multiples are precomputed
+    point3 = multi_multiply([
+        (s_inv * hash_digest, generator_odd_multiples(GENERATOR_WNAF_WIDTH)),
+        (s_inv * signature.r, key.odd_multiples),
+    ])
+    if point3.z == 0:
+        return False
 
     # check x coordinate of this point matches the x-coordinate of the random point given
-    return point3.x == signature.r
+    return to_affine(point3).x == signature.r
 
 # ------
 # Generate private ECDSA key
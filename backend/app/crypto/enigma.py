@@ -3,12 +3,35 @@
 
     Based on one of the many variants of the Enigma Machine.
     Engima M3 UKW-B Reflector
+
+    Letters A-Z are handled as indices 0-25. Every rotor is compiled once into
+    26-entry substitution tables per shift (position - ring), and the left
+    rotor, middle rotor and reflector into one table per slow rotor state, so
+    a letter costs three table lookups.
 '''
 
 
-from typing import List, Dict
+from functools import lru_cache
+from typing import List, Dict, NamedTuple, Tuple
 from enum import Enum
 
+ALPHABET = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+ALPHABET_BYTES = ALPHABET.encode('ascii')
+LETTER_COUNT = len(ALPHABET)
+
+# bytes.translate tables between ASCII letters and letter indices
+IDENTITY_TABLE = bytes(range(256))
+TO_INDEX = bytes.maketrans(ALPHABET_BYTES, bytes(range(LETTER_COUNT)))
+TO_LETTER = bytes.maketrans(bytes(range(LETTER_COUNT)), ALPHABET_BYTES)
+
+# the middle rotor turns 25 times per revolution: once per right rotor
+# revolution, except that the double step takes it past its notch for free
+STEPPING_PERIOD = LETTER_COUNT * (LETTER_COUNT - 1) * LETTER_COUNT
+
+# from this many letters on, each rotor state encrypts every letter it
+# recurs at in one translate call instead of stepping letter by letter
+PERIODIC_MIN_LENGTH = 8 * STEPPING_PERIOD
+
 class EnigmaRotor(Enum):
     I = 0
     II = 1
@@ -21,44 +44,146 @@ class EnigmaRotor(Enum):
     '''
     @classmethod
     def get_wiring(cls, rotor: 'EnigmaRotor'):
-        if rotor == EnigmaRotor.I:
-            return "EKMFLGDQVZNTOWYHXUSPAIBRCJ"
-        if rotor == EnigmaRotor.II:
-            return "AJDKSIRUXBLHWTMCQGZNPYFVOE"
-        if rotor == EnigmaRotor.III:
-            return "BDFHJLCPRTXVZNYEIWGAKMUSQO"
-        if rotor == EnigmaRotor.IV:
-            return "ESOVPZJAYQUIRHXLNFTGKDCMWB"
-
-        raise ValueError()
+        if rotor not in ROTOR_WIRING:
+            raise ValueError()
+        return ROTOR_WIRING[rotor]
 
     @classmethod
     def get_inverse_wiring(cls, rotor: 'EnigmaRotor'):
-        if rotor == EnigmaRotor.I:
-            return "UWYGADFPVZBECKMTHXSLRINQOJ"
-        if rotor == EnigmaRotor.II:
-            return "AJPCZWRLFBDKOTYUQGENHXMIVS"
-        if rotor == EnigmaRotor.III:
-            return "TAGBPCSDQEUFVNZHYIXJWLRKOM"
-        if rotor == EnigmaRotor.IV:
-            return "HZWVARTNLGUPXQCEJMBSKDYOIF"
-
-        raise ValueError()
+        if rotor not in ROTOR_INVERSE_WIRING:
+            raise ValueError()
+        return ROTOR_INVERSE_WIRING[rotor]
 
     @classmethod
     def get_turnover_notch(cls, rotor: 'EnigmaRotor'):
-        if rotor == EnigmaRotor.I:
-            return "Q"
-        if rotor == EnigmaRotor.II:
-            return "E"
-        if rotor == EnigmaRotor.III:
-            return "V"
-        if rotor == EnigmaRotor.IV:
-            return "J"
+        if rotor not in ROTOR_TURNOVER_NOTCH:
+            raise ValueError()
+        return ROTOR_TURNOVER_NOTCH[rotor]
+
+ROTOR_WIRING = {
+    EnigmaRotor.I: "EKMFLGDQVZNTOWYHXUSPAIBRCJ",
+    EnigmaRotor.II: "AJDKSIRUXBLHWTMCQGZNPYFVOE",
+    EnigmaRotor.III: "BDFHJLCPRTXVZNYEIWGAKMUSQO",
+    EnigmaRotor.IV: "ESOVPZJAYQUIRHXLNFTGKDCMWB",
+}
+
+ROTOR_INVERSE_WIRING = {
+    EnigmaRotor.I: "UWYGADFPVZBECKMTHXSLRINQOJ",
+    EnigmaRotor.II: "AJPCZWRLFBDKOTYUQGENHXMIVS",
+    EnigmaRotor.III: "TAGBPCSDQEUFVNZHYIXJWLRKOM",
+    EnigmaRotor.IV: "HZWVARTNLGUPXQCEJMBSKDYOIF",
+}
+
+ROTOR_TURNOVER_NOTCH = {
+    EnigmaRotor.I: "Q",
+    EnigmaRotor.II: "E",
+    EnigmaRotor.III: "V",
+    EnigmaRotor.IV: "J",
+}
+
+def notch_index(rotor: EnigmaRotor) -> int:
+    return ALPHABET.index(EnigmaRotor.get_turnover_notch(rotor))
+
+@lru_cache(maxsize=None)
+def compile_rotor(rotor: EnigmaRotor) -> Tuple[Tuple[bytes, ...], Tuple[bytes, ...]]:
+    '''
+    Forward and inverse wiring of rotor for every shift (position - ring), as
+    bytes.translate tables on letter indices
+    '''
+    wiring = [ALPHABET.index(letter) for letter in EnigmaRotor.get_wiring(rotor)]
+    inverse_wiring = [ALPHABET.index(letter) for letter in EnigmaRotor.get_inverse_wiring(rotor)]
+
+    def table(wiring: List[int], shift: int) -> bytes:
+        substitution = bytes(
+            (wiring[(letter + shift) % LETTER_COUNT] - shift) % LETTER_COUNT
+            for letter in range(LETTER_COUNT)
+        )
+        return substitution + IDENTITY_TABLE[LETTER_COUNT:]
+
+    return (
+        tuple(table(wiring, shift) for shift in range(LETTER_COUNT)),
+        tuple(table(inverse_wiring, shift) for shift in range(LETTER_COUNT)),
+    )
+
+@lru_cache(maxsize=None)
+def compile_slow_rotors(left: EnigmaRotor, middle: EnigmaRotor, left_shift: int, middle_shift: int) -> bytes:
+    '''
+    Middle rotor -> left rotor -> reflector -> left rotor -> middle rotor as one table
+    '''
+    left_forward, left_inverse = compile_rotor(left)
+    middle_forward, middle_inverse = compile_rotor(middle)
+    return (
+        middle_forward[middle_shift]
+        .translate(left_forward[left_shift])
+        .translate(REFLECTOR_TABLE)
+        .translate(left_inverse[left_shift])
+        .translate(middle_inverse[middle_shift])
+    )
+
+class StepPeriod(NamedTuple):
+    transient: int
+    period: int
+
+def _step(positions: List[int], middle_notch: int, right_notch: int) -> List[int]:
+    left, middle, right = positions
+    if middle == middle_notch:
+        middle = (middle + 1) % 26
+        left = (left + 1) % 26
+    if right == right_notch:
+        middle = (middle + 1) % 26
+    return [left, middle, (right + 1) % 26]
+
+def rotor_positions_at(rotors: List[EnigmaRotor], positions: List[int], offset: int) -> List[int]:
+    '''
+    Rotor positions after offset letters, starting from positions, computed
+    directly from the stepping rules instead of stepping offset times
+    '''
+    if offset < 0:
+        raise ValueError('offset must not be negative')
+
+    middle_notch = notch_index(rotors[1])
+    right_notch = notch_index(rotors[2])
+    if offset == 0:
+        return list(positions)
+
+    # a middle rotor resting on its notch double steps right away
+    if positions[1] == middle_notch:
+        positions = _step(positions, middle_notch, right_notch)
+        offset -= 1
+    left, middle, right = positions
 
-        raise ValueError()
+    # the right rotor kicks the middle rotor on steps first_kick, first_kick + 26, ...
+    first_kick = (right_notch - right) % 26 + 1
+    kicks = 0 if offset < first_kick else (offset - first_kick) // 26 + 1
+
+    # kick number to_notch puts the middle rotor on its notch, then every 25th
+    # kick after that; each is followed by a double step on the next letter
+    to_notch = (middle_notch - middle) % 26
+    double_steps = 0 if kicks < to_notch else (kicks - to_notch) // 25 + 1
+    if double_steps and (kicks - to_notch) % 25 == 0 and first_kick + 26 * (kicks - 1) == offset:
+        # the last kick landed on the notch at the very last letter
+        double_steps -= 1
+
+    return [(left + double_steps) % 26, (middle + kicks + double_steps) % 26, (right + offset) % 26]
+
+def stepping_period(rotors: List[EnigmaRotor], positions: List[int]) -> StepPeriod:
+    '''
+    Number of letters before the rotor positions become periodic, and the period.
+    Only the middle rotor parked on its notch, or just past it with the right
+    rotor one past its notch, is off the cycle; both join it after one letter.
+    '''
+    middle_notch = notch_index(rotors[1])
+    right_notch = notch_index(rotors[2])
+    _, middle, right = positions
+
+    kicked = right == (right_notch + 1) % LETTER_COUNT
+    if (middle == middle_notch and not kicked) or (middle == (middle_notch + 1) % LETTER_COUNT and kicked):
+        return StepPeriod(1, STEPPING_PERIOD)
+    return StepPeriod(0, STEPPING_PERIOD)
 
 class EnigmaMachine:
+    __slots__ = ('rotors', 'rotor_positions', 'rings', 'plugboard', 'plugboard_table', '_input_table', '_output_table')
+
     REFLECTOR = {
         "A":"Y",
         "Y":"A",
@@ -91,20 +216,38 @@ class EnigmaMachine:
     '''
     Enigma Machine constructor
     Arguments:
-        rotors: 3 positional EnigmaRotor (left to right). 
-        rings: 3 positional rotor offset
+        rotors: 3 positional EnigmaRotor (left to right).
+        positions: 3 positional rotor start position, 0 for A
+        rings: 3 positional rotor offset, 0 for A
+        plugboard: letter pairs to swap, e.g. {"A": "B"} swaps A and B
     '''
     def __init__(self, rotors:List[EnigmaRotor], positions: List[int], rings: List[int], plugboard: Dict[str,str]) -> None:
-        self.rotors = rotors
-        self.rotor_positions = positions
-        self.rings = rings
+        if len(rotors) != 3 or len(positions) != 3 or len(rings) != 3:
+            raise ValueError('the M3 machine needs 3 rotors, positions and rings')
+
+        self.rotors = tuple(rotors)
+        self.rotor_positions = [position % LETTER_COUNT for position in positions]
+        self.rings = [ring % LETTER_COUNT for ring in rings]
         self.plugboard = plugboard
+        self.plugboard_table = self._compile_plugboard(plugboard)
+
+        # ASCII -> plugboard -> index, and index -> plugboard -> ASCII
+        self._input_table = TO_INDEX.translate(self.plugboard_table)
+        self._output_table = self.plugboard_table.translate(TO_LETTER)
+
+    def _compile_plugboard(self, plugboard: Dict[str,str]) -> bytes:
+        table = bytearray(IDENTITY_TABLE)
+        for letter, substitute in plugboard.items():
+            if len(letter) != 1 or len(substitute) != 1 or not (letter + substitute).isalpha():
+                raise ValueError('plugboard must map single letters A-Z')
+            letter, substitute = ALPHABET.index(letter.upper()), ALPHABET.index(substitute.upper())
+            if table[letter] not in (letter, substitute) or table[substitute] not in (letter, substitute):
+                raise ValueError('a letter can only be plugged once')
+            table[letter], table[substitute] = substitute, letter
+        return bytes(table)
 
     def _plugboard_substitution(self, letter: str) -> str:
-        if letter in self.plugboard:
-            return self.plugboard[letter]
-        else:
-            return letter
+        return ALPHABET[self.plugboard_table[ALPHABET.index(letter)]]
 
     def _reflector_substitution(self, letter:str) -> str:
         return self.REFLECTOR[letter]
@@ -138,42 +281,99 @@ class EnigmaMachine:
         return letter
 
     def _advance_rotors(self):
-        # if chr(self.rotor_positions[1]  + ord('A')) == EnigmaRotor.get_turnover_notch(self.rotors[1]):
-        #     self.rotor_positions[1] = (self.rotor_positions[1] + 1) % 26
-        #     self.rotor_positions[0] = (self.rotor_positions[0] + 1) % 26
-        # if chr(self.rotor_positions[2]  + ord('A')) == EnigmaRotor.get_turnover_notch(self.rotors[2]):
-        #     self.rotor_positions[1] = (self.rotor_positions[1] + 1) % 26
+        positions = self.rotor_positions
+        if positions[1] == notch_index(self.rotors[1]):
+            # double step: the middle rotor moves on again and takes the left rotor with it
+            positions[1] = (positions[1] + 1) % 26
+            positions[0] = (positions[0] + 1) % 26
+        if positions[2] == notch_index(self.rotors[2]):
+            positions[1] = (positions[1] + 1) % 26
+        positions[2] = (positions[2] + 1) % 26
 
-        # self.rotor_positions[2] = (self.rotor_positions[2] + 1) % 26
-        pass
+    def stepping_period(self) -> StepPeriod:
+        return stepping_period(self.rotors, self.rotor_positions)
 
     def encrypt(self, message: str) -> str:
-        cipher_text = ""
-        for letter in message:
-            self._advance_rotors()
-            letter = self._plugboard_substitution(letter)
-            print("initial plugboard", letter)
-            letter = self._forward_substitution(letter)
-            print("forward sub", letter)
-            # letter = self._reflector_substitution(letter)
-            # print("reflector sub", letter)
-            letter = self._backward_substitution(letter)
-            print("backward sub", letter)
-            letter = self._plugboard_substitution(letter)
-            print("final plugboard", letter)
-            cipher_text += letter
-            print("============")
+        '''
+        Encrypt (or decrypt, the machine is its own inverse) a message of the
+        letters A-Z, moving the rotors on by one position per letter
+        '''
+        letters = message.encode('ascii')
+        if letters.translate(None, ALPHABET_BYTES):
+            raise ValueError('message must only contain the letters A-Z')
+
+        letters = letters.translate(self._input_table)
+        if len(letters) >= PERIODIC_MIN_LENGTH:
+            cipher_text = self._encrypt_periodic(letters)
+        else:
+            cipher_text = self._encrypt_letters(letters)
+        return cipher_text.translate(self._output_table).decode('ascii')
+
+    def _encrypt_letters(self, letters: bytes) -> bytearray:
+        rotors = self.rotors
+        left_ring, middle_ring, right_ring = self.rings
+        left, middle, right = self.rotor_positions
+        middle_notch = notch_index(rotors[1])
+        right_notch = notch_index(rotors[2])
+        right_forward, right_inverse = compile_rotor(rotors[2])
+
+        cipher_text = bytearray(len(letters))
+        slow_rotors = None
+        for i, letter in enumerate(letters):
+            # same stepping as _advance_rotors
+            if middle == middle_notch:
+                middle = (middle + 1) % 26
+                left = (left + 1) % 26
+                slow_rotors = None
+            if right == right_notch:
+                middle = (middle + 1) % 26
+                slow_rotors = None
+            right = (right + 1) % 26
+
+            if slow_rotors is None:
+                slow_rotors = compile_slow_rotors(rotors[0], rotors[1], (left - left_ring) % 26, (middle - middle_ring) % 26)
+
+            shift = (right - right_ring) % 26
+            cipher_text[i] = right_inverse[shift][slow_rotors[right_forward[shift][letter]]]
+
+        self.rotor_positions[:] = [left, middle, right]
         return cipher_text
 
-encryptor = EnigmaMachine(rotors=[EnigmaRotor.I], 
-                          positions=[0,0,0], rings=[0,0,0], plugboard={})
-cipher = encryptor.encrypt("H")
+    def _encrypt_periodic(self, letters: bytes) -> bytearray:
+        # past the transient, letters STEPPING_PERIOD apart see the same rotor state
+        transient = self.stepping_period().transient
+        cipher_text = bytearray(len(letters))
+        cipher_text[:transient] = self._encrypt_letters(letters[:transient])
 
-decryptor = EnigmaMachine(rotors=[EnigmaRotor.I],
-                           positions=[0,0,0], rings=[0,0,0],  plugboard={})
-plaintext = decryptor.encrypt(cipher)
-print(cipher)
-print(plaintext)
+        rotors = self.rotors
+        left_ring, middle_ring, right_ring = self.rings
+        left, middle, right = self.rotor_positions
+        middle_notch = notch_index(rotors[1])
+        right_notch = notch_index(rotors[2])
+        right_forward, right_inverse = compile_rotor(rotors[2])
+
+        steps = len(letters) - transient
+        final_step = (steps - 1) % STEPPING_PERIOD
+        final_positions = None
+        for step in range(min(steps, STEPPING_PERIOD)):
+            if middle == middle_notch:
+                middle = (middle + 1) % 26
+                left = (left + 1) % 26
+            if right == right_notch:
+                middle = (middle + 1) % 26
+            right = (right + 1) % 26
+
+            shift = (right - right_ring) % 26
+            table = right_forward[shift].translate(
+                compile_slow_rotors(rotors[0], rotors[1], (left - left_ring) % 26, (middle - middle_ring) % 26)
+            ).translate(right_inverse[shift])
+
+            start = transient + step
+            cipher_text[start::STEPPING_PERIOD] = letters[start::STEPPING_PERIOD].translate(table)
+            if step == final_step:
+                final_positions = [left, middle, right]
+
+        self.rotor_positions[:] = final_positions
+        return cipher_text
 
-print(EnigmaRotor.get_wiring(EnigmaRotor.I)[ord('H') - ord('A')])
-print(EnigmaRotor.get_inverse_wiring(EnigmaRotor.I)[ord('Q') - ord('A')])
\ No newline at end of file
+REFLECTOR_TABLE = bytes(ALPHABET.index(EnigmaMachine.REFLECTOR[letter]) for letter in ALPHABET) + IDENTITY_TABLE[LETTER_COUNT:]
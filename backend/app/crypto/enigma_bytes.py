@@ -1,5 +1,7 @@
-from typing import List, Dict
+from array import array
+from typing import List, Dict, NamedTuple, Optional, Tuple
 from enum import Enum
+from functools import lru_cache
 
 class EnigmaBytesRotor(Enum):
     I = 0
@@ -19,20 +21,137 @@ class EnigmaBytesRotor(Enum):
         if rotor == EnigmaBytesRotor.I:
             return int.from_bytes(b';',byteorder="big")
         
+IDENTITY_TABLE = bytes(range(256))
+
+@lru_cache(maxsize=None)
+def compile_rotor(rotor: EnigmaBytesRotor) -> Tuple[Tuple[bytes, ...], Tuple[bytes, ...]]:
+    '''
+    Forward and inverse wiring of rotor for every shift (position - ring),
+    as 256-byte substitution tables for bytes.translate
+    '''
+    wiring = EnigmaBytesRotor.get_wiring(rotor)
+    inverse_wiring = EnigmaBytesRotor.get_inverse_wiring(rotor)
+
+    forward, inverse = [], []
+    for shift in range(256):
+        # x -> (wiring[(x + shift) % 256] - shift) % 256
+        subtract = IDENTITY_TABLE[256 - shift:] + IDENTITY_TABLE[:256 - shift]
+        forward.append((wiring[shift:] + wiring[:shift]).translate(subtract))
+        inverse.append((inverse_wiring[shift:] + inverse_wiring[:shift]).translate(subtract))
+    return tuple(forward), tuple(inverse)
+
+@lru_cache(maxsize=1024)
+def compile_slow_rotors(left: EnigmaBytesRotor, middle: EnigmaBytesRotor, left_shift: int, middle_shift: int) -> bytes:
+    '''
+    Middle rotor -> left rotor -> reflector -> left rotor -> middle rotor as one table.
+    It only changes when the middle rotor steps, i.e. at most once every 256 bytes.
+    '''
+    left_forward, left_inverse = compile_rotor(left)
+    middle_forward, middle_inverse = compile_rotor(middle)
+    return (
+        middle_forward[middle_shift]
+        .translate(left_forward[left_shift])
+        .translate(REFLECTOR_TABLE)
+        .translate(left_inverse[left_shift])
+        .translate(middle_inverse[middle_shift])
+    )
+
+# the middle rotor turns 255 times per revolution: once per right rotor
+# revolution, except that the double step takes it past its notch for free
+MIDDLE_ROTOR_PERIOD = 255 * 256
+STEPPING_PERIOD = 256 * MIDDLE_ROTOR_PERIOD
+
+class StepPeriod(NamedTuple):
+    transient: int
+    period: int
+
+def _step(positions: List[int], middle_notch: int, right_notch: int) -> List[int]:
+    left, middle, right = positions
+    if middle == middle_notch:
+        middle = (middle + 1) % 256
+        left = (left + 1) % 256
+    if right == right_notch:
+        middle = (middle + 1) % 256
+    return [left, middle, (right + 1) % 256]
+
+def rotor_positions_at(rotors: List[EnigmaBytesRotor], positions: List[int], offset: int) -> List[int]:
+    '''
+    Rotor positions after offset bytes, starting from positions, computed
+    directly from the stepping rules instead of stepping offset times
+    '''
+    if offset < 0:
+        raise ValueError('offset must not be negative')
+
+    middle_notch = EnigmaBytesRotor.get_turnover_notch(rotors[1])
+    right_notch = EnigmaBytesRotor.get_turnover_notch(rotors[2])
+    if offset == 0:
+        return list(positions)
+
+    # a middle rotor resting on its notch double steps right away
+    if positions[1] == middle_notch:
+        positions = _step(positions, middle_notch, right_notch)
+        offset -= 1
+    left, middle, right = positions
+
+    # the right rotor kicks the middle rotor on steps first_kick, first_kick + 256, ...
+    first_kick = (right_notch - right) % 256 + 1
+    kicks = 0 if offset < first_kick else (offset - first_kick) // 256 + 1
+
+    # kick number to_notch puts the middle rotor on its notch, then every 255th
+    # kick after that; each is followed by a double step on the next byte
+    to_notch = (middle_notch - middle) % 256
+    double_steps = 0 if kicks < to_notch else (kicks - to_notch) // 255 + 1
+    if double_steps and (kicks - to_notch) % 255 == 0 and first_kick + 256 * (kicks - 1) == offset:
+        # the last kick landed on the notch at the very last byte
+        double_steps -= 1
+
+    return [(left + double_steps) % 256, (middle + kicks + double_steps) % 256, (right + offset) % 256]
+
+def stepping_period(rotors: List[EnigmaBytesRotor], positions: List[int]) -> StepPeriod:
+    '''
+    Number of bytes before the rotor positions become periodic, and the period.
+    Only the middle rotor parked on its notch, or just past it with the right
+    rotor one past its notch, is off the cycle; both join it after one byte.
+    '''
+    middle_notch = EnigmaBytesRotor.get_turnover_notch(rotors[1])
+    right_notch = EnigmaBytesRotor.get_turnover_notch(rotors[2])
+    _, middle, right = positions
+
+    kicked = right == (right_notch + 1) % 256
+    if (middle == middle_notch and not kicked) or (middle == (middle_notch + 1) % 256 and kicked):
+        return StepPeriod(1, STEPPING_PERIOD)
+    return StepPeriod(0, STEPPING_PERIOD)
+
 class EnigmaBytesMachine:
+    __slots__ = ('rotors', 'rotor_positions', 'start_positions', 'rings', 'plugboard', 'plugboard_table')
+
     REFLECTOR = {b'\xf0': b'\x10', b'\x10': b'\xf0', b'\xce': b'\n', b'\n': b'\xce', b'\x06': b')', b')': b'\x06', b'\xcb': b'@', b'@': b'\xcb', b'\xa5': b'\xc6', b'\xc6': b'\xa5', b'\xea': b';', b';': b'\xea', b'\x14': b'M', b'M': b'\x14', b'J': b'%', b'%': b'J', b'\x8e': b'~', b'~': b'\x8e', b'\x87': b"'", b"'": b'\x87', b'}': b'o', b'o': b'}', b'\xde': b'\x02', b'\x02': b'\xde', b'|': b'i', b'i': b'|', b'8': b'-', b'-': b'8', b'c': b'y', b'y': b'c', b'\x8b': b'\x11', b'\x11': b'\x8b', b'\x91': b'\x05', b'\x05': b'\x91', b'\xda': b'\xc2', b'\xc2': b'\xda', b'\xcd': b'D', b'D': b'\xcd', b'\xca': b'\xd3', b'\xd3': b'\xca', b'\xc3': b'B', b'B': b'\xc3', b'\xf7': b'\xcf', b'\xcf': b'\xf7', b'\x9e': b'\xa2', b'\xa2': b'\x9e', b'\xcc': b'\xff', b'\xff': b'\xcc', b'\x81': b'\x16', b'\x16': b'\x81', b'W': b'\xfa', b'\xfa': b'W', b'\xb1': b'[', b'[': b'\xb1', b'\x1d': b'*', b'*': b'\x1d', b'\x9b': b'\x19', b'\x19': b'\x9b', b'\xac': b'\x83', b'\x83': b'\xac', b'\x84': b'9', b'9': b'\x84', b'z': b'\xc8', b'\xc8': b'z', b'#': b'\x8a', b'\x8a': b'#', b'\x0b': b'f', b'f': b'\x0b', b'g': b'A', b'A': b'g', b'Y': b'\xf4', b'\xf4': b'Y', b']': b'?', b'?': b']', b'\x00': b'F', b'F': b'\x00', b'>': b'\x0f', b'\x0f': b'>', b'\x97': b'\x95', b'\x95': b'\x97', b'\xe8': b'\x9d', b'\x9d': b'\xe8', b'a': b'\xe1', b'\xe1': b'a', b'\xd6': b't', b't': b'\xd6', b'\x1f': b'\xed', b'\xed': b'\x1f', b',': b'\x1c', b'\x1c': b',', b'I': b'\xfd', b'\xfd': b'I', b'\xc4': b'_', b'_': b'\xc4', b'\x03': b'\xe4', b'\xe4': b'\x03', b'\x93': b'\x1a', b'\x1a': b'\x93', b' ': b'\xb0', b'\xb0': b' ', b'\xf6': b'\x82', b'\x82': b'\xf6', b'\x92': b'3', b'3': b'\x92', b'7': b'\x15', b'\x15': b'7', b'\x12': b'\x8d', b'\x8d': b'\x12', b'\xae': b'5', b'5': b'\xae', b'\xee': b'V', b'V': b'\xee', b'0': b'd', b'd': b'0', b'\xb6': b'x', b'x': b'\xb6', b'O': b'\xd4', b'\xd4': b'O', b'&': b'\r', b'\r': b'&', b'\xa9': b'\xd2', b'\xd2': b'\xa9', b'\xb8': b'C', b'C': b'\xb8', b'\x1b': b'S', b'S': b'\x1b', b'\xd5': b'(', b'(': b'\xd5', b'\xa3': b'\xec', b'\xec': b'\xa3', b'\xa7': b'\xe2', b'\xe2': b'\xa7', b'\x9a': b'2', b'2': b'\x9a', b'\x88': b'\xbb', b'\xbb': b'\x88', b'\xc0': b'{', b'{': b'\xc0', b'\t': b'n', b'n': b'\t', b'N': b'\xb5', b'\xb5': b'N', b'l': b'\xbe', b'\xbe': b'l', b'\x18': b'\x07', b'\x07': b'\x18', b'\x85': b'\xa8', b'\xa8': b'\x85', b'=': b'\x9f', b'\x9f': b'=', b'\xb9': b'\xf8', b'\xf8': b'\xb9', b'\x04': b'u', b'u': b'\x04', b'X': b'\xa6', b'\xa6': b'X', b'.': b'r', b'r': b'.', b'p': b'!', b'!': b'p', b'\xfe': b'G', b'G': b'\xfe', b'w': b'6', b'6': b'w', b'<': b'1', b'1': b'<', b'\xbc': b'\x99', b'\x99': b'\xbc', b'\xe0': b'\x9c', b'\x9c': b'\xe0', b'\xc7': b'\xbd', b'\xbd': b'\xc7', b'\xe7': b'P', b'P': b'\xe7', b'\x8f': b'\xe6', b'\xe6': b'\x8f', b'j': b'`', b'`': b'j', b'\xbf': b'm', b'm': b'\xbf', b'U': b'\x01', b'\x01': b'U', b'R': b'b', b'b': b'R', b'\xd1': b'\xdb', b'\xdb': b'\xd1', b'\xaf': b'\xf2', b'\xf2': b'\xaf', b'\x0e': b'\xaa', b'\xaa': b'\x0e', b'\xdd': b'\x90', b'\x90': b'\xdd', b'\x98': b'\xe3', b'\xe3': b'\x98', b'\xa0': b'Z', b'Z': b'\xa0', b'\xdc': b'4', b'4': b'\xdc', b'\xeb': b'e', b'e': b'\xeb', b'\xab': b'H', b'H': b'\xab', b'\x96': b'+', b'+': b'\x96', b'\xb2': b'\x94', b'\x94': b'\xb2', b'\xf5': b'k', b'k': b'\xf5', b'q': b'\xf9', b'\xf9': b'q', b'\xfb': b's', b's': b'\xfb', b'\x13': b'\xd8', b'\xd8': b'\x13', b'L': b'\xf1', b'\xf1': b'L', b'\xb7': b'\x86', b'\x86': b'\xb7', b'/': b'T', b'T': b'/', b'\xef': b'\xc1', b'\xc1': b'\xef', b'\x7f': b'\xfc', b'\xfc': b'\x7f', b'\x0c': b'\xc9', b'\xc9': b'\x0c', b'\x08': b'v', b'v': b'\x08', b'h': b'Q', b'Q': b'h', b'\xb3': b'\x8c', b'\x8c': b'\xb3', b'"': b'K', b'K': b'"', b'\xd9': b'\xa4', b'\xa4': b'\xd9', b'E': b'\xc5', b'\xc5': b'E', b'\xe9': b'\xd0', b'\xd0': b'\xe9', b':': b'\x89', b'\x89': b':', b'^': b'\xad', b'\xad': b'^', b'\xe5': b'\xba', b'\xba': b'\xe5', b'$': b'\xdf', b'\xdf': b'$', b'\x17': b'\x80', b'\x80': b'\x17', b'\x1e': b'\xb4', b'\xb4': b'\x1e', b'\\': b'\xa1', b'\xa1': b'\\', b'\xf3': b'\xd7', b'\xd7': b'\xf3'}
 
     '''
     Enigma Machine constructor
     Arguments:
         rotors: 3 positional EnigmaBytesRotor (left to right).
-        rings: 3 positional rotor offset
+        positions: 3 positional rotor start position, kept as a byte array
+        rings: 3 positional rotor offset, kept as a byte array
     '''
     def __init__(self, rotors:List[EnigmaBytesRotor], positions: List[int], rings: List[int], plugboard: Dict[bytes,bytes]) -> None:
-        self.rotors = rotors
-        self.rotor_positions = positions
-        self.rings = rings
+        self.rotors = tuple(rotors)
+        self.rotor_positions = array('B', [position % 256 for position in positions])
+        self.start_positions = array('B', self.rotor_positions)
+        self.rings = array('B', [ring % 256 for ring in rings])
         self.plugboard = plugboard
+        self.plugboard_table = self._compile_plugboard(plugboard)
+
+    def _compile_plugboard(self, plugboard: Dict[bytes,bytes]) -> Optional[bytes]:
+        if not plugboard:
+            return None
+
+        table = bytearray(IDENTITY_TABLE)
+        for letter, substitute in plugboard.items():
+            letter = letter[0] if isinstance(letter, bytes) else letter
+            substitute = substitute[0] if isinstance(substitute, bytes) else substitute
+            table[letter] = substitute
+        return bytes(table)
 
     def _plugboard_substitution(self, letter: bytes) -> bytes:
         if letter in self.plugboard:
@@ -41,7 +160,7 @@ class EnigmaBytesMachine:
             return letter
 
     def _reflector_substitution(self, letter:int) -> bytes:
-        return int.from_bytes(self.REFLECTOR[bytes([letter])], byteorder="big")
+        return REFLECTOR_TABLE[letter]
 
     def _forward_substitution(self, letter:bytes)->bytes:
         rotor_positions = self.rotor_positions
@@ -81,18 +200,101 @@ class EnigmaBytesMachine:
             self.rotor_positions[1] = (self.rotor_positions[1] + 1) % 256
         self.rotor_positions[2] = (self.rotor_positions[2] + 1) % 256
 
+    def advance(self, steps: int) -> None:
+        '''
+        Step the rotors as if steps bytes had been encrypted
+        '''
+        self.rotor_positions[:] = array('B', rotor_positions_at(self.rotors, self.rotor_positions, steps))
+
+    def state_at(self, offset: int) -> List[int]:
+        '''
+        Rotor positions after offset bytes of a message started with this machine
+        '''
+        return rotor_positions_at(self.rotors, self.start_positions, offset)
+
+    def seek(self, offset: int) -> None:
+        '''
+        Position the rotors at byte offset of the message, so that encrypt
+        continues from message[offset:]
+        '''
+        self.rotor_positions[:] = array('B', self.state_at(offset))
+
+    def period(self) -> StepPeriod:
+        return stepping_period(self.rotors, self.start_positions)
+
+    def state_table(self) -> bytes:
+        '''
+        Substitution of the whole plugboard -> rotors -> reflector -> rotors -> plugboard
+        path for the current rotor positions (the state the next byte sees after stepping)
+        '''
+        right_forward, right_inverse = compile_rotor(self.rotors[2])
+        right_shift = (self.rotor_positions[2] - self.rings[2]) % 256
+
+        table = self.plugboard_table or IDENTITY_TABLE
+        table = table.translate(right_forward[right_shift]).translate(self._slow_rotor_table())
+        table = table.translate(right_inverse[right_shift])
+        if self.plugboard_table is not None:
+            table = table.translate(self.plugboard_table)
+        return table
+
+    def _slow_rotor_table(self) -> bytes:
+        return compile_slow_rotors(
+            self.rotors[0],
+            self.rotors[1],
+            (self.rotor_positions[0] - self.rings[0]) % 256,
+            (self.rotor_positions[1] - self.rings[1]) % 256,
+        )
+
     def encrypt(self, message: bytes) -> bytes:
-        cipher_text = b""
-        for letter in message:
-            self._advance_rotors()
-            letter = self._plugboard_substitution(letter)
-            letter = self._forward_substitution(letter)
-            letter = self._reflector_substitution(letter)
-            letter = self._backward_substitution(letter)
-            letter = self._plugboard_substitution(letter)
-            cipher_text += bytes([letter])
-        return cipher_text
-    
+        cipher_text = bytearray(len(message))
+        self.encrypt_into(message, cipher_text)
+        return bytes(cipher_text)
+
+    def encrypt_into(self, message: bytes, output: bytearray) -> int:
+        '''
+        Encrypt message into the writable buffer output (bytearray, memoryview, ...)
+        and return the number of bytes written. Nothing is allocated per byte.
+        '''
+        length = len(message)
+        if len(output) < length:
+            raise ValueError('output buffer is smaller than the message')
+
+        rotors = self.rotors
+        positions = self.rotor_positions
+        left_ring, middle_ring, right_ring = self.rings
+        left, middle, right = positions
+        middle_notch = EnigmaBytesRotor.get_turnover_notch(rotors[1])
+        right_notch = EnigmaBytesRotor.get_turnover_notch(rotors[2])
+        right_forward, right_inverse = compile_rotor(rotors[2])
+
+        if self.plugboard_table is not None:
+            # fold the plugboard into the right rotor tables
+            right_forward = [self.plugboard_table.translate(table) for table in right_forward]
+            right_inverse = [table.translate(self.plugboard_table) for table in right_inverse]
+
+        slow_rotors = None
+        for i, letter in enumerate(message):
+            # same stepping as _advance_rotors
+            if middle == middle_notch:
+                middle = (middle + 1) % 256
+                left = (left + 1) % 256
+                slow_rotors = None
+            if right == right_notch:
+                middle = (middle + 1) % 256
+                slow_rotors = None
+            right = (right + 1) % 256
+
+            if slow_rotors is None:
+                slow_rotors = compile_slow_rotors(rotors[0], rotors[1], (left - left_ring) % 256, (middle - middle_ring) % 256)
+
+            shift = (right - right_ring) % 256
+            output[i] = right_inverse[shift][slow_rotors[right_forward[shift][letter]]]
+
+        positions[0], positions[1], positions[2] = left, middle, right
+        return length
+
+REFLECTOR_TABLE = bytes(EnigmaBytesMachine.REFLECTOR[bytes([letter])][0] for letter in range(256))
+
 # encryptor = EnigmaBytesMachine(rotors=[EnigmaBytesRotor.I, EnigmaBytesRotor.I, EnigmaBytesRotor.I],
 #                           positions=[1,3,245], rings=[1,200,100], plugboard={})
 # original_plaintext = b'3\xb1\x95o\x06A\x9f\xc4H\xaf\xd71.g*\xe2a\xe6\xb3\x93\xefi\xc9\xc5\x91M\xba\x1e\xff\x0b\x08m_\x11\x9c<9k\xa9+\x03wF\xa6\x04\xfa\xe5\xd9Z|\xdf\xa0\xa4\x15;\xcd\x18:@\x9b\xc2Px4(\xfcS\x1f\x96\xe0]\xb5\x8fR\x1c\xfe\xe1v\x13\xeb>)\xc6\x81\'\x90\xbfz\\\xb9eBp\x8c\x10\x9a\xfd\x17\x1b\xf7d\xa7s7\xaef\xce\x98\x86\x07\xcf\x88E~\x16 \xc7TY8\xb8\xf5\x82=5-\xc1\xfb\x1a\x000\x87\xbe\xa1%\x8b\xea\x14[\x89/l2\xf1\xab\xca\xe8\xe4\xcb\n\xed\xf0\x9e\x92\x12U\x7f?\xf2\x01\xd0y\x80\x85\xda\xc3\xaa\xcc\xec\xe9\xa3Kj\x83\xc0\xdd\xbc\xf4q\xf8\xd1h\xe7V\xbbu\x05\xa5G\xf3\xd5\xd3\xad\x0e\x02W,\x8enr$\x9d\xd2\xde\r!\xa2I"\xb7&Nb\xbd\xd6J\xd8`\t\xb4\xd4\xb2\xe3\x1d\x0c\xa8c\xf6#6\xdbDL\xb6\x19\xc8\xdc\xac}\x0f\xf9\x94{QC\x8a\xeet\x8dO\x97X^\xb0\x99\x843\xb1\x95o\x06A\x9f\xc4H\xaf\xd71.g*\xe2a\xe6\xb3\x93\xefi\xc9\xc5\x91M\xba\x1e\xff\x0b\x08m_\x11\x9c<9k\xa9+\x03wF\xa6\x04\xfa\xe5\xd9Z|\xdf\xa0\xa4\x15;\xcd\x18:@\x9b\xc2Px4(\xfcS\x1f\x96\xe0]\xb5\x8fR\x1c\xfe\xe1v\x13\xeb>)\xc6\x81\'\x90\xbfz\\\xb9eBp\x8c\x10\x9a\xfd\x17\x1b\xf7d\xa7s7\xaef\xce\x98\x86\x07\xcf\x88E~\x16 \xc7TY8\xb8\xf5\x82=5-\xc1\xfb\x1a\x000\x87\xbe\xa1%\x8b\xea\x14[\x89/l2\xf1\xab\xca\xe8\xe4\xcb\n\xed\xf0\x9e\x92\x12U\x7f?\xf2\x01\xd0y\x80\x85\xda\xc3\xaa\xcc\xec\xe9\xa3Kj\x83\xc0\xdd\xbc\xf4q\xf8\xd1h\xe7V\xbbu\x05\xa5G\xf3\xd5\xd3\xad\x0e\x02W,\x8enr$\x9d\xd2\xde\r!\xa2I"\xb7&Nb\xbd\xd6J\xd8`\t\xb4\xd4\xb2\xe3\x1d\x0c\xa8c\xf6#6\xdbDL\xb6\x19\xc8\xdc\xac}\x0f\xf9\x94{QC\x8a\xeet\x8dO\x97X^\xb0\x99\x84'
@@ -0,0 +1,211 @@
+'''
+    Vectorised EnigmaBytesMachine
+
+    Runs M independent EnigmaBytesMachine with the same rotors at once. Rotor
+    positions and rings are kept in (M, 3) arrays, all machines step
+    together one message byte at a time, and the forward,
+    reflector and backward wiring are applied as gathers into the compiled
+    rotor tables. Worth it from a few hundred machines on; the per byte
+    cost is then a handful of NumPy calls shared by all of them.
+'''
+from functools import lru_cache
+from typing import List, Optional, Sequence
+import numpy as np
+from .enigma_bytes import EnigmaBytesMachine, EnigmaBytesRotor, REFLECTOR_TABLE, compile_rotor
+
+REFLECTOR_ARRAY = np.frombuffer(REFLECTOR_TABLE, dtype=np.uint8)
+
+@lru_cache(maxsize=None)
+def rotor_arrays(rotor: EnigmaBytesRotor):
+    '''
+    Forward and inverse tables of rotor as flat (256 * 256,) arrays,
+    entry shift << 8 | letter
+    '''
+    forward, inverse = compile_rotor(rotor)
+    return (
+        np.frombuffer(b''.join(forward), dtype=np.uint8),
+        np.frombuffer(b''.join(inverse), dtype=np.uint8),
+    )
+
+class EnigmaBytesBatch():
+    '''
+    Batched Enigma bytes machine
+    Arguments:
+        rotors: 3 positional EnigmaBytesRotor (left to right), shared by every machine
+        positions: (M, 3) rotor positions, one row per machine
+        rings: (M, 3) rotor offsets
+        plugboards: optional (M, 256) plugboard substitution tables
+    '''
+    def __init__(self, rotors: List[EnigmaBytesRotor], positions, rings, plugboards: Optional[np.ndarray] = None) -> None:
+        positions = np.array(positions, dtype=np.int64).reshape(-1, 3) % 256
+        rings = np.array(rings, dtype=np.int64).reshape(-1, 3) % 256
+        if positions.shape != rings.shape:
+            raise ValueError('positions and rings must have the same number of machines')
+        if plugboards is not None:
+            plugboards = np.asarray(plugboards, dtype=np.uint8)
+            if plugboards.shape != (len(positions), 256):
+                raise ValueError('plugboards must have shape (M, 256)')
+
+        self.rotors = tuple(rotors)
+        self.positions = positions
+        self.rings = rings
+        self.plugboards = plugboards
+        self.tables = [rotor_arrays(rotor) for rotor in self.rotors]
+
+    @classmethod
+    def from_machines(cls, machines: Sequence[EnigmaBytesMachine]) -> 'EnigmaBytesBatch':
+        rotors = machines[0].rotors
+        if any(machine.rotors != rotors for machine in machines):
+            raise ValueError('every machine in a batch must use the same rotors')
+
+        plugboards = None
+        if any(machine.plugboard_table is not None for machine in machines):
+            plugboards = np.array(
+                [np.frombuffer(machine.plugboard_table or bytes(range(256)), dtype=np.uint8) for machine in machines]
+            )
+        return cls(
+            rotors,
+            [list(machine.rotor_positions) for machine in machines],
+            [list(machine.rings) for machine in machines],
+            plugboards,
+        )
+
+    @classmethod
+    def from_offsets(cls, machine: EnigmaBytesMachine, offsets: Sequence[int]) -> 'EnigmaBytesBatch':
+        '''
+        One copy of machine per offset, each moved on by that many bytes
+        '''
+        offsets = np.asarray(offsets, dtype=np.int64)
+        single = cls.from_machines([machine])
+        plugboards = None if single.plugboards is None else np.repeat(single.plugboards, len(offsets), axis=0)
+        return cls(
+            machine.rotors,
+            single.positions_at(offsets[None, :])[0],
+            np.repeat(single.rings, len(offsets), axis=0),
+            plugboards,
+        )
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    def positions_at(self, offsets: np.ndarray) -> np.ndarray:
+        '''
+        Rotor positions after offsets bytes, offsets of shape (M,) or (M, K).
+        Returns shape offsets.shape + (3,).
+        '''
+        return np.stack(self._positions(offsets), axis=-1)
+
+    def _positions(self, offsets: np.ndarray):
+        # vectorised rotor_positions_at, see there for the derivation
+        offsets = np.asarray(offsets, dtype=np.int64)
+        if (offsets < 0).any():
+            raise ValueError('offset must not be negative')
+
+        extra = (slice(None),) + (None,) * (offsets.ndim - 1)
+        left, middle, right = (self.positions[:, i][extra] for i in range(3))
+        middle_notch = EnigmaBytesRotor.get_turnover_notch(self.rotors[1])
+        right_notch = EnigmaBytesRotor.get_turnover_notch(self.rotors[2])
+
+        # a middle rotor resting on its notch double steps right away
+        parked = (middle == middle_notch) & (offsets > 0)
+        left = left + parked
+        middle = middle + parked + (parked & (right == right_notch))
+        right = right + parked
+        steps = offsets - parked
+
+        # first_kick is 1..256, so this is 0 before the first kick
+        first_kick = ((right_notch - right) & 255) + 1
+        kicks = (steps - first_kick + 256) >> 8
+
+        # 1..256, a middle rotor left parked at offset 0 is 256 kicks away
+        to_notch = ((middle_notch - middle - 1) & 255) + 1
+        past_notch = kicks - to_notch
+        double_steps = np.maximum(past_notch // 255 + 1, 0)
+        # the kick onto the notch was the very last step, its double step is still due
+        double_steps -= (past_notch >= 0) & (past_notch % 255 == 0) & (first_kick + 256 * (kicks - 1) == steps)
+
+        return (left + double_steps) & 255, (middle + kicks + double_steps) & 255, (right + steps) & 255
+
+    def encrypt(self, messages) -> np.ndarray:
+        '''
+        Encrypt one message per machine, messages of shape (M, L) (uint8 array
+        or M equal length bytes). Every machine moves on by L bytes.
+        '''
+        cipher_text, positions = self._encrypt_array(self._messages_array(messages))
+        self.positions = positions
+        return cipher_text
+
+    def encrypt_messages(self, messages: Sequence[bytes]) -> List[bytes]:
+        '''
+        Encrypt messages of any length, one per machine. Each machine moves
+        on by the length of its own message.
+        '''
+        if len(messages) != len(self):
+            raise ValueError('expected one message per machine')
+
+        lengths = np.array([len(message) for message in messages], dtype=np.int64)
+        width = int(lengths.max(initial=0))
+        padded = np.zeros((len(self), width), dtype=np.uint8)
+        for i, message in enumerate(messages):
+            padded[i, : len(message)] = np.frombuffer(message, dtype=np.uint8)
+
+        cipher_text, _ = self._encrypt_array(padded)
+        self.positions = self.positions_at(lengths)
+        return [cipher_text[i, :length].tobytes() for i, length in enumerate(lengths)]
+
+    def _encrypt_array(self, messages: np.ndarray):
+        # one contiguous row of M letters per message byte
+        columns = np.ascontiguousarray(messages.T)
+        cipher_text = np.empty_like(columns)
+
+        # rotors are tracked as their table row, (position - ring) << 8, and the
+        # notches as the table row each machine has when its rotor is on the notch
+        rows = ((self.positions - self.rings) & 255).astype(np.intp) << 8
+        left, middle, right = rows[:, 0].copy(), rows[:, 1].copy(), rows[:, 2].copy()
+        notches = (np.array([EnigmaBytesRotor.get_turnover_notch(rotor) for rotor in self.rotors]) - self.rings) & 255
+        middle_notch, right_notch = notches[:, 1].astype(np.intp) << 8, notches[:, 2].astype(np.intp) << 8
+        (left_forward, left_inverse), (middle_forward, middle_inverse), (right_forward, right_inverse) = self.tables
+
+        plugboards = None
+        if self.plugboards is not None:
+            plugboards = self.plugboards.reshape(-1)
+            plugboard_rows = np.arange(len(self)) * 256
+
+        for i, letters in enumerate(columns):
+            # same stepping as EnigmaBytesMachine._advance_rotors, for every machine
+            parked = (middle == middle_notch) << 8
+            kicked = (right == right_notch) << 8
+            left += parked
+            left &= 0xFF00
+            middle += parked
+            middle += kicked
+            middle &= 0xFF00
+            right += 256
+            right &= 0xFF00
+
+            # tables are flattened, indexed by (position - ring) << 8 | letter
+            if plugboards is not None:
+                letters = plugboards[plugboard_rows + letters]
+            letters = right_forward[right | letters]
+            letters = middle_forward[middle | letters]
+            letters = left_forward[left | letters]
+            letters = REFLECTOR_ARRAY[letters]
+            letters = left_inverse[left | letters]
+            letters = middle_inverse[middle | letters]
+            letters = right_inverse[right | letters]
+            if plugboards is not None:
+                letters = plugboards[plugboard_rows + letters]
+            cipher_text[i] = letters
+
+        positions = ((np.stack((left, middle, right), axis=1) >> 8) + self.rings) & 255
+        return np.ascontiguousarray(cipher_text.T), positions
+
+    def _messages_array(self, messages) -> np.ndarray:
+        if not isinstance(messages, np.ndarray):
+            if len({len(message) for message in messages}) > 1:
+                raise ValueError('messages must all have the same length, use encrypt_messages')
+            messages = np.array([np.frombuffer(message, dtype=np.uint8) for message in messages], dtype=np.uint8)
+            messages = messages.reshape(len(self), -1)
+        if messages.ndim != 2 or len(messages) != len(self):
+            raise ValueError('messages must have shape (M, L)')
+        return messages.astype(np.uint8, copy=False)
@@ -0,0 +1,160 @@
+'''
+    ParallelHash (NIST SP 800-185) on the SHA3 Keccak core
+
+    The input is split into leaves of block_size bytes, every leaf is hashed
+    on its own with SHAKE into a chaining value, and the chaining values are
+    absorbed in order by cSHAKE with the function name "ParallelHash". Leaves
+    are independent, so they are hashed in a shared process pool,
+    PARALLEL_TASK_SIZE bytes of leaves per task.
+
+    reference: https://doi.org/10.6028/NIST.SP.800-185
+'''
+from typing import BinaryIO, Optional, Union
+from .process_pool import shared_process_pool
+from .sha3 import SHAKE, SHA3Instance, Buffer, FILE_CHUNK_SIZE
+
+# default leaf size B, in bytes
+PARALLEL_HASH_BLOCK_SIZE = 8192
+
+# bytes of leaves hashed by one process pool task
+PARALLEL_TASK_SIZE = 1024 * 1024
+
+def left_encode(x: int) -> bytes:
+    encoded = x.to_bytes(max(1, (x.bit_length() + 7) // 8), byteorder='big')
+    return bytes([len(encoded)]) + encoded
+
+def right_encode(x: int) -> bytes:
+    encoded = x.to_bytes(max(1, (x.bit_length() + 7) // 8), byteorder='big')
+    return encoded + bytes([len(encoded)])
+
+def encode_string(s: bytes) -> bytes:
+    return left_encode(8 * len(s)) + s
+
+def bytepad(x: bytes, w: int) -> bytes:
+    z = left_encode(w) + x
+    return z + bytes(-len(z) % w)
+
+class CSHAKE(SHAKE):
+    """
+    cSHAKE128/cSHAKE256, SHAKE with a function name and customization string
+
+    With both empty it is SHAKE itself, as SP 800-185 defines.
+    """
+
+    def __init__(self, instance: SHA3Instance, data: Union[Buffer, BinaryIO] = b'', function_name: bytes = b'', customization: bytes = b'') -> None:
+        super().__init__(instance)
+        self.name = f"cshake_{self.specs.c // 2}"
+
+        if function_name or customization:
+            self.specs.mbits = [0,0]
+            self.update(bytepad(encode_string(function_name) + encode_string(customization), self.block_size))
+
+        if hasattr(data, 'read'):
+            self.update_file(data)
+        elif data:
+            self.update(data)
+
+def _chaining_values(instance: SHA3Instance, leaf_size: int, data: bytes) -> bytes:
+    """
+    SHAKE chaining values of every leaf_size leaf of data, concatenated
+    """
+    chaining_size = SHAKE(instance).specs.c // 8
+    view = memoryview(data)
+    return b''.join(
+        SHAKE(instance, view[offset:offset+leaf_size]).digest(chaining_size)
+        for offset in range(0, len(view), leaf_size)
+    )
+
+class ParallelHash():
+    """
+    hashlib-style ParallelHash128/ParallelHash256 hash object
+
+    Arguments:
+        instance: SHAKE128 for ParallelHash128, SHAKE256 for ParallelHash256
+        block_size: leaf size B in bytes, part of the hash like customization
+        workers: processes hashing leaves, from the process pool shared by
+            everything using this many workers; leaves are only buffered
+            until every worker has a PARALLEL_TASK_SIZE task
+    """
+    name: str
+    digest_size: int
+
+    def __init__(
+        self,
+        instance: SHA3Instance = SHA3Instance.SHAKE128,
+        data: Union[Buffer, BinaryIO] = b'',
+        block_size: int = PARALLEL_HASH_BLOCK_SIZE,
+        customization: bytes = b'',
+        workers: int = 1
+    ) -> None:
+        if instance not in (SHA3Instance.SHAKE128, SHA3Instance.SHAKE256):
+            raise ValueError('ParallelHash instance must be SHAKE128 or SHAKE256')
+        if block_size <= 0:
+            raise ValueError('block_size must be positive')
+
+        self.instance = instance
+        self.leaf_size = block_size
+        self.workers = workers
+
+        self._outer = CSHAKE(instance, left_encode(block_size), b'ParallelHash', customization)
+        self._leaves = 0
+        self._buffer = bytearray()
+
+        self.name = f"parallelhash_{self._outer.specs.c // 2}"
+        self.digest_size = self._outer.specs.c // 8
+
+        # whole leaves per task, and bytes buffered before they are hashed
+        self._task_size = max(1, PARALLEL_TASK_SIZE // block_size) * block_size
+        self._flush_size = self._task_size * workers if workers > 1 else block_size
+
+        if hasattr(data, 'read'):
+            self.update_file(data)
+        elif data:
+            self.update(data)
+
+    def update(self, data: Buffer) -> None:
+        self._buffer += memoryview(data).cast('B')
+        if len(self._buffer) >= self._flush_size:
+            full = len(self._buffer) - len(self._buffer) % self.leaf_size
+            self._leaves += self._absorb_leaves(self._outer, self._buffer[:full])
+            del self._buffer[:full]
+
+    def update_file(self, file: BinaryIO, chunk_size: int = FILE_CHUNK_SIZE) -> None:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            self.update(chunk)
+
+    def _absorb_leaves(self, outer: CSHAKE, data: bytes) -> int:
+        """
+        Absorb the chaining values of data's leaves into outer, and return
+        the number of leaves; the last leaf may be partial
+        """
+        if self.workers <= 1 or len(data) <= self._task_size:
+            outer.update(_chaining_values(self.instance, self.leaf_size, data))
+        else:
+            tasks = [bytes(data[start:start+self._task_size]) for start in range(0, len(data), self._task_size)]
+            executor = shared_process_pool(self.workers)
+            for chaining_values in executor.map(_chaining_values, [self.instance] * len(tasks), [self.leaf_size] * len(tasks), tasks):
+                outer.update(chaining_values)
+
+        return -(-len(data) // self.leaf_size)
+
+    def copy(self) -> 'ParallelHash':
+        other = ParallelHash.__new__(ParallelHash)
+        other.__dict__.update(self.__dict__)
+        other._outer = self._outer.copy()
+        other._buffer = bytearray(self._buffer)
+        return other
+
+    def digest(self, length: Optional[int] = None) -> bytes:
+        if length is None:
+            length = self.digest_size
+
+        # finish a copy, so more can be absorbed afterwards
+        outer = self._outer.copy()
+        leaves = self._leaves + self._absorb_leaves(outer, self._buffer)
+
+        outer.update(right_encode(leaves) + right_encode(8 * length))
+        return outer.read(length)
+
+    def hexdigest(self, length: Optional[int] = None) -> str:
+        return self.digest(length).hex()
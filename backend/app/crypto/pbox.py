@@ -0,0 +1,57 @@
+from typing import List
+
+
+class PBox():
+    '''
+    Precompiled bit permutation (P-box)
+
+    Output bit i takes the value of input bit pbox[i], bits are numbered
+    from the most significant bit of the first byte. For every input byte
+    a 256-entry table holds the output bits that byte contributes, so a
+    permutation is 8 table lookups OR-ed together instead of a walk over
+    every output bit.
+    '''
+    def __init__(self, pbox: List[int], input_length: int = 8) -> None:
+        if any(i < 0 or i >= input_length * 8 for i in pbox):
+            raise ValueError('pbox refers to bits outside of the input')
+
+        self.pbox = list(pbox)
+        self.input_length = input_length
+        self.output_length = (len(pbox) + 7) // 8
+
+        output_bits = self.output_length * 8
+
+        self.tables = []
+        for byte_idx in range(input_length):
+            # output bit masks of each of the 8 bits of this input byte
+            masks = [0] * 8
+            for i, source in enumerate(pbox):
+                if source // 8 == byte_idx:
+                    masks[source % 8] |= 1 << (output_bits - 1 - i)
+
+            table = []
+            for value in range(256):
+                out = 0
+                for bit_idx in range(8):
+                    if (value >> (7 - bit_idx)) & 0x01:
+                        out |= masks[bit_idx]
+                table.append(out)
+            self.tables.append(table)
+
+    def permute_int(self, value: int) -> int:
+        '''
+        Permute a big-endian integer of input_length bytes
+        '''
+        tables = self.tables
+        shift = (self.input_length - 1) * 8
+        out = 0
+        for table in tables:
+            out |= table[(value >> shift) & 0xFF]
+            shift -= 8
+        return out
+
+    def permute(self, input_bytes: bytes) -> bytes:
+        out = 0
+        for table, value in zip(self.tables, input_bytes):
+            out |= table[value]
+        return out.to_bytes(self.output_length, byteorder='big')
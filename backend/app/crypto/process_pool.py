@@ -0,0 +1,25 @@
+'''
+    Process pools shared across requests
+
+    Starting a pool forks all of its workers, so one pool per worker count
+    is created on first use and kept for the life of the process instead
+    of being started and shut down around every large input. A pool that
+    broke because a worker died (OOM kill, crash) is replaced on the next
+    request.
+'''
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict
+import threading
+
+_POOLS: Dict[int, ProcessPoolExecutor] = {}
+_LOCK = threading.Lock()
+
+def shared_process_pool(workers: int) -> ProcessPoolExecutor:
+    with _LOCK:
+        pool = _POOLS.get(workers)
+        if pool is not None and pool._broken:
+            pool.shutdown(wait=False)
+            pool = None
+        if pool is None:
+            pool = _POOLS[workers] = ProcessPoolExecutor(max_workers=workers)
+        return pool
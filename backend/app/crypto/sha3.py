@@ -1,4 +1,7 @@
 from enum import Enum
+from typing import BinaryIO, Union
+import mmap
+import struct
 
 # reference: https://keccak.team/keccak_specs_summary.html
 
@@ -7,6 +10,8 @@ class SHA3Instance(Enum):
     SHA256 = 1
     SHA384 = 2
     SHA512 = 3
+    SHAKE128 = 4
+    SHAKE256 = 5
 
 class SHA3Specification():
     r: int
@@ -35,38 +40,195 @@ class SHA3Specification():
         self.nr = 24
         self.w = 64
 
+MASK = (1 << 64) - 1
+
+# update_file reads files through a buffer of this many bytes
+FILE_CHUNK_SIZE = 1024 * 1024
+
+Buffer = Union[bytes, bytearray, memoryview, mmap.mmap]
+
 KECCAK_RC = [
-    "0x0000000000000001",
-    "0x0000000000008082",
-    "0x800000000000808A",
-    "0x8000000080008000",
-    "0x000000000000808B",
-    "0x0000000080000001",
-    "0x8000000080008081",
-    "0x8000000000008009",
-    "0x000000000000008A",
-    "0x0000000000000088",
-    "0x0000000080008009",
-    "0x000000008000000A",
-    "0x000000008000808B",
-    "0x800000000000008B",
-    "0x8000000000008089",
-    "0x8000000000008003",
-    "0x8000000000008002",
-    "0x8000000000000080",
-    "0x000000000000800A",
-    "0x800000008000000A",
-    "0x8000000080008081",
-    "0x8000000000008080",
-    "0x0000000080000001",
-    "0x8000000080008008",
+    0x0000000000000001,
+    0x0000000000008082,
+    0x800000000000808A,
+    0x8000000080008000,
+    0x000000000000808B,
+    0x0000000080000001,
+    0x8000000080008081,
+    0x8000000000008009,
+    0x000000000000008A,
+    0x0000000000000088,
+    0x0000000080008009,
+    0x000000008000000A,
+    0x000000008000808B,
+    0x800000000000008B,
+    0x8000000000008089,
+    0x8000000000008003,
+    0x8000000000008002,
+    0x8000000000000080,
+    0x000000000000800A,
+    0x800000008000000A,
+    0x8000000080008081,
+    0x8000000000008080,
+    0x0000000080000001,
+    0x8000000080008008,
 ]
 
+# rho rotation offsets, KECCAK_RHO[x][y] for lane (x, y)
+KECCAK_RHO = [
+    [0, 36, 3, 41, 18],
+    [1, 44, 10, 45, 2],
+    [62, 6, 43, 15, 61],
+    [28, 55, 25, 21, 56],
+    [27, 20, 39, 8, 14],
+]
+
+def keccak_f1600(lanes: list[int]) -> list[int]:
+    """
+    Keccak-f[1600] on 25 64-bit lanes, lane (x, y) at index x + 5*y
+
+    Rounds are unrolled over named lanes, rho and pi are folded into one
+    step with the rotation offsets of KECCAK_RHO written in.
+    """
+    (
+        a00, a10, a20, a30, a40,
+        a01, a11, a21, a31, a41,
+        a02, a12, a22, a32, a42,
+        a03, a13, a23, a33, a43,
+        a04, a14, a24, a34, a44,
+    ) = lanes
+    mask = MASK
+
+    for rc in KECCAK_RC:
+        # theta
+        c0 = a00 ^ a01 ^ a02 ^ a03 ^ a04
+        c1 = a10 ^ a11 ^ a12 ^ a13 ^ a14
+        c2 = a20 ^ a21 ^ a22 ^ a23 ^ a24
+        c3 = a30 ^ a31 ^ a32 ^ a33 ^ a34
+        c4 = a40 ^ a41 ^ a42 ^ a43 ^ a44
+        d0 = c4 ^ (((c1 << 1) | (c1 >> 63)) & mask)
+        d1 = c0 ^ (((c2 << 1) | (c2 >> 63)) & mask)
+        d2 = c1 ^ (((c3 << 1) | (c3 >> 63)) & mask)
+        d3 = c2 ^ (((c4 << 1) | (c4 >> 63)) & mask)
+        d4 = c3 ^ (((c0 << 1) | (c0 >> 63)) & mask)
+
+        # rho and pi
+        b00 = a00 ^ d0
+        t = a01 ^ d0
+        b13 = ((t << 36) | (t >> 28)) & mask
+        t = a02 ^ d0
+        b21 = ((t << 3) | (t >> 61)) & mask
+        t = a03 ^ d0
+        b34 = ((t << 41) | (t >> 23)) & mask
+        t = a04 ^ d0
+        b42 = ((t << 18) | (t >> 46)) & mask
+        t = a10 ^ d1
+        b02 = ((t << 1) | (t >> 63)) & mask
+        t = a11 ^ d1
+        b10 = ((t << 44) | (t >> 20)) & mask
+        t = a12 ^ d1
+        b23 = ((t << 10) | (t >> 54)) & mask
+        t = a13 ^ d1
+        b31 = ((t << 45) | (t >> 19)) & mask
+        t = a14 ^ d1
+        b44 = ((t << 2) | (t >> 62)) & mask
+        t = a20 ^ d2
+        b04 = ((t << 62) | (t >> 2)) & mask
+        t = a21 ^ d2
+        b12 = ((t << 6) | (t >> 58)) & mask
+        t = a22 ^ d2
+        b20 = ((t << 43) | (t >> 21)) & mask
+        t = a23 ^ d2
+        b33 = ((t << 15) | (t >> 49)) & mask
+        t = a24 ^ d2
+        b41 = ((t << 61) | (t >> 3)) & mask
+        t = a30 ^ d3
+        b01 = ((t << 28) | (t >> 36)) & mask
+        t = a31 ^ d3
+        b14 = ((t << 55) | (t >> 9)) & mask
+        t = a32 ^ d3
+        b22 = ((t << 25) | (t >> 39)) & mask
+        t = a33 ^ d3
+        b30 = ((t << 21) | (t >> 43)) & mask
+        t = a34 ^ d3
+        b43 = ((t << 56) | (t >> 8)) & mask
+        t = a40 ^ d4
+        b03 = ((t << 27) | (t >> 37)) & mask
+        t = a41 ^ d4
+        b11 = ((t << 20) | (t >> 44)) & mask
+        t = a42 ^ d4
+        b24 = ((t << 39) | (t >> 25)) & mask
+        t = a43 ^ d4
+        b32 = ((t << 8) | (t >> 56)) & mask
+        t = a44 ^ d4
+        b40 = ((t << 14) | (t >> 50)) & mask
+
+        # chi and iota
+        a00 = b00 ^ (~b10 & b20) ^ rc
+        a10 = b10 ^ (~b20 & b30)
+        a20 = b20 ^ (~b30 & b40)
+        a30 = b30 ^ (~b40 & b00)
+        a40 = b40 ^ (~b00 & b10)
+        a01 = b01 ^ (~b11 & b21)
+        a11 = b11 ^ (~b21 & b31)
+        a21 = b21 ^ (~b31 & b41)
+        a31 = b31 ^ (~b41 & b01)
+        a41 = b41 ^ (~b01 & b11)
+        a02 = b02 ^ (~b12 & b22)
+        a12 = b12 ^ (~b22 & b32)
+        a22 = b22 ^ (~b32 & b42)
+        a32 = b32 ^ (~b42 & b02)
+        a42 = b42 ^ (~b02 & b12)
+        a03 = b03 ^ (~b13 & b23)
+        a13 = b13 ^ (~b23 & b33)
+        a23 = b23 ^ (~b33 & b43)
+        a33 = b33 ^ (~b43 & b03)
+        a43 = b43 ^ (~b03 & b13)
+        a04 = b04 ^ (~b14 & b24)
+        a14 = b14 ^ (~b24 & b34)
+        a24 = b24 ^ (~b34 & b44)
+        a34 = b34 ^ (~b44 & b04)
+        a44 = b44 ^ (~b04 & b14)
+
+    return [
+        a00, a10, a20, a30, a40,
+        a01, a11, a21, a31, a41,
+        a02, a12, a22, a32, a42,
+        a03, a13, a23, a33, a43,
+        a04, a14, a24, a34, a44,
+    ]
+
 class SHA3():
+    """
+    hashlib-style SHA3 hash object
+
+    Message bytes are absorbed a rate-sized block at a time as they are
+    passed to update(), so only the 25 lanes and a partial block are kept.
+    data may be any bytes-like object, a memory-mapped file or a binary
+    file object, which is read to the end FILE_CHUNK_SIZE bytes at a time.
+    """
     specs: SHA3Specification
+    name: str
+    digest_size: int
+    block_size: int
 
-    def __init__(self, instance: SHA3Instance) -> None:
+    def __init__(self, instance: SHA3Instance, data: Union[Buffer, BinaryIO] = b'') -> None:
         self.specs = self._instance_param_to_specs(instance)
+        if instance in (SHA3Instance.SHAKE128, SHA3Instance.SHAKE256):
+            self.name = f"shake_{self.specs.c // 2}"
+        else:
+            self.name = f"sha3_{self.specs.output_length}"
+        self.digest_size = self.specs.output_length // 8
+        self.block_size = self.specs.r // 8
+
+        self._lane_format = f"<{self.block_size // 8}Q"
+        self._lanes = [0] * 25
+        self._buffer = bytearray()
+
+        if hasattr(data, 'read') and not isinstance(data, mmap.mmap):
+            self.update_file(data)
+        elif data:
+            self.update(data)
 
     def _instance_param_to_specs(self, instance: SHA3Instance) -> SHA3Specification:
         if instance == SHA3Instance.SHA224:
@@ -81,136 +243,158 @@ class SHA3():
         if instance == SHA3Instance.SHA512:
             return SHA3Specification(576,1024, 512,[0,1])
 
+        # SHAKE output lengths are only the default of SHA3.digest()
+        if instance == SHA3Instance.SHAKE128:
+            return SHA3Specification(1344,256, 256,[1,1,1,1])
+
+        if instance == SHA3Instance.SHAKE256:
+            return SHA3Specification(1088,512, 512,[1,1,1,1])
+
         raise ValueError()
 
-    def _pad_message(self, intermediate: list[int]) -> str:
+    def _pad_message(self, message: bytes) -> bytes:
         """
-        Return the padded binary list (intermediate)
+        Return the padded message
 
-        Intermediate is padded such that it's divisible by r
+        Message is padded with P (mbits) and 10*1 such that it's divisible by r.
+        Bits are taken least significant first within a byte, so P and the first
+        1 share the first pad byte, and the last 1 is the top bit of the last byte.
         """
-        r = self.specs.r
-
-        if len(intermediate) % r == 0:
-            return intermediate
-
-        # add pad of P (mbits)
-        intermediate.extend(self.specs.mbits)
-
-        # add pad of 10*1
-        intermediate.extend([1,0])
-        while (len(intermediate) + 1) % r != 0:
-            intermediate.append(0)
-        intermediate.append(1)
-
-        return intermediate
-
-    def _xor_word(self, l1:list[int], l2:list[int]) -> list[int]:
-        assert len(l1) == len(l2)
-
-        l3 = [0 for _ in range(len(l1))]
-
-        for i in range(len(l1)):
-            l3[i] = l1[i] ^ l2[i]
-
-        return l3
-
-    def _rotl(self, x:list[int], n:int) -> list[int]:
-        return x[n:] + x[:n]
-
-    def _neg_word(self, x:list[int]) -> list[int]:
-        return [~bit & 1 for bit in x]
-
-    def _and_word(self, l1:list[int], l2:list[int]) -> list[int]:
-        assert len(l1) == len(l2)
-
-        return [l1[i] & l2[i] for i in range(len(l1))]
-
-    def digest(self, message: str) -> str:
-        # Convert message to a binary list
-        intermediate = [int(b) for ch in message for b in bin(ord(ch))[2:].zfill(8)]
-
-        intermediate = self._keccak(intermediate)
-
-        return intermediate
-
-    def _keccak(self, intermediate:list[int]) -> list[int]:
-        r = self.specs.r
-        w = self.specs.w
-        output_length = self.specs.output_length
-
-        # Padding
-        intermediate = self._pad_message(intermediate)
-
-        # Initialization
-        S = [[[0 for _ in range(w)] for _ in range(5)] for _ in range(5)]
-
-        # Absorbing phase
-        for i in range(0, int(len(intermediate)/r), r):
-            pi = intermediate[i:i+r]
-
-            for y in range(len(S)):
-                for x in range(len(S)):
-                    if x + 5*y < r/w:
-                        offset = (x + 5 *y) * w
-                        S[y][x] = self._xor_word(S[y][x], pi[offset:offset+w])
-                        S = self._keccak_f1600_permutation(S)
-
-        # Squeezing phase, we assumes only 1 output that is requested (fixed length)
-        Z = []
-        for y in range(len(S)):
-            for x in range(len(S)):
-                if len(Z) >= output_length:
-                    break
-
-                if x + 5*y < r/w:
-                    Z.extend(S[y][x])
-
-        return Z[:output_length]
-
-    def _keccak_f1600_permutation(self, state: list[int]) -> list[int]:
-        nr = self.specs.nr
-        w = self.specs.w
-
-        def round1600(A: list[list[int]], RC:list[int]) -> list[int]:
-            # Theta
-            C = [[0 for _ in range(w)] for _ in range(5)]
-            D = [[0 for _ in range(w)] for _ in range(5)]
-
-            for x in range(5):
-                C[x] = self._xor_word(self._xor_word(self._xor_word(self._xor_word(A[0][x], A[1][x]), A[2][x]), A[3][x]), A[4][x])
-
-            for x in range(5):
-                D[x] = self._xor_word(C[(x-1) % 5], self._rotl(C[(x+1) % 5], 1))
-
-            A = [[self._xor_word(A[y][x], D[x]) for x in range(5)] for y in range(5)]
-
-            # Rho Pi
-            x, y = 1, 0
-            current = A[y][x]
-            for t in range(24):
-                x, y = y, (2*x+3*y) % 5
-                current, A[y][x] = A[y][x], self._rotl(current, (t+1)*(t+2)//2)
-
-            # Chi
-            for y in range(5):
-                T = [A[y][x] for x in range(5)]
-                for x in range(5):
-                    A[y][x] = self._xor_word(T[x], self._and_word(self._neg_word(T[(x+1)%5]), T[(x+2) % 5]))
-
-            # Iota
-            A[0][0] = self._xor_word(A[0][0], RC)
-
-            return A
-
-        for i in range(nr):
-            state = round1600(state, [int(bit) for byte in bytes.fromhex(KECCAK_RC[i][2:]) for bit in f"{byte:08b}"][-w:])
-        return state
-
-# Example usage
-
-plain = "ABCD"
-sha3 = SHA3(SHA3Instance.SHA256)
-digest = sha3.digest(plain)
-
-# print(digest)
+        rate = self.block_size
+        suffix = sum(bit << i for i, bit in enumerate(self.specs.mbits)) | (1 << len(self.specs.mbits))
+
+        padding = bytearray(rate - len(message) % rate)
+        padding[0] |= suffix
+        padding[-1] |= 0x80
+
+        return message + padding
+
+    def _absorb(self, lanes: list[int], block: bytes) -> list[int]:
+        for i, lane in enumerate(struct.unpack(self._lane_format, block)):
+            lanes[i] ^= lane
+        return keccak_f1600(lanes)
+
+    def update(self, data: Buffer) -> None:
+        data = memoryview(data).cast('B')
+        rate = self.block_size
+
+        # top up a partial block left by the previous update first
+        if self._buffer:
+            missing = rate - len(self._buffer)
+            self._buffer += data[:missing]
+            data = data[missing:]
+            if len(self._buffer) < rate:
+                return
+            self._lanes = self._absorb(self._lanes, self._buffer)
+            self._buffer = bytearray()
+
+        full = len(data) - len(data) % rate
+        for offset in range(0, full, rate):
+            self._lanes = self._absorb(self._lanes, data[offset:offset+rate])
+        self._buffer += data[full:]
+
+    def update_file(self, file: BinaryIO, chunk_size: int = FILE_CHUNK_SIZE) -> None:
+        """
+        Absorb a binary file from its current position to the end, reading
+        it into one chunk_size buffer
+        """
+        buffer = bytearray(chunk_size)
+        view = memoryview(buffer)
+        readinto = getattr(file, 'readinto', None)
+
+        while True:
+            if readinto is not None:
+                chunk = view[:readinto(buffer) or 0]
+            else:
+                chunk = file.read(chunk_size)
+            if not chunk:
+                break
+            self.update(chunk)
+
+    def copy(self) -> 'SHA3':
+        other = type(self).__new__(type(self))
+        other.__dict__.update(self.__dict__)
+        other._lanes = list(self._lanes)
+        other._buffer = bytearray(self._buffer)
+        return other
+
+    def digest(self) -> bytes:
+        # pad a copy of the state, so more can be absorbed afterwards
+        lanes = self._absorb(list(self._lanes), self._pad_message(bytes(self._buffer)))
+
+        # Squeezing phase, the output fits in one block for every SHA3 instance
+        Z = struct.pack(self._lane_format, *lanes[:self.block_size // 8])
+
+        return Z[:self.digest_size]
+
+    def hexdigest(self) -> str:
+        return self.digest().hex()
+
+class SHAKE(SHA3):
+    """
+    hashlib-style SHAKE128/SHAKE256 extendable-output function
+
+    digest(length) and hexdigest(length) work like hashlib.shake_*. read(n)
+    squeezes the output as a stream instead, permuting the state again only
+    when the current rate block has been used up; no update() is allowed
+    once reading has started.
+    """
+
+    def __init__(self, instance: SHA3Instance, data: Union[Buffer, BinaryIO] = b'') -> None:
+        if instance not in (SHA3Instance.SHAKE128, SHA3Instance.SHAKE256):
+            raise ValueError('SHAKE instance must be SHAKE128 or SHAKE256')
+
+        self._squeezed = None
+        self._block = b''
+        self._offset = 0
+
+        super().__init__(instance, data)
+        # an XOF has no fixed digest size, as in hashlib
+        self.digest_size = 0
+
+    def update(self, data: Buffer) -> None:
+        if self._squeezed is not None:
+            raise ValueError('cannot update after read()')
+        super().update(data)
+
+    def copy(self) -> 'SHAKE':
+        other = super().copy()
+        if self._squeezed is not None:
+            other._squeezed = list(self._squeezed)
+        return other
+
+    def read(self, n: int) -> bytes:
+        """
+        Next n bytes of output, continuing where the previous read stopped
+        """
+        if n < 0:
+            raise ValueError('length must not be negative')
+
+        if self._squeezed is None:
+            self._squeezed = self._absorb(list(self._lanes), self._pad_message(bytes(self._buffer)))
+            self._block = struct.pack(self._lane_format, *self._squeezed[:self.block_size // 8])
+            self._offset = 0
+
+        rate = self.block_size
+        chunks = []
+        while n > 0:
+            if self._offset == rate:
+                self._squeezed = keccak_f1600(self._squeezed)
+                self._block = struct.pack(self._lane_format, *self._squeezed[:rate // 8])
+                self._offset = 0
+
+            take = min(n, rate - self._offset)
+            chunks.append(self._block[self._offset:self._offset+take])
+            self._offset += take
+            n -= take
+
+        return b''.join(chunks)
+
+    def digest(self, length: int) -> bytes:
+        # squeeze a fresh copy, so earlier or later reads are not affected
+        other = self.copy()
+        other._squeezed = None
+        return other.read(length)
+
+    def hexdigest(self, length: int) -> str:
+        return self.digest(length).hex()
@@ -0,0 +1,101 @@
+'''
+    Vectorised SHA3
+
+    Runs Keccak-f[1600] on N independent states at once, held as (25, N)
+    uint64 arrays with lane (x, y) in row x + 5*y, for hashing many short
+    messages. Messages are padded up front and grouped by their number of
+    rate-sized blocks, so every state in a group absorbs the same number
+    of blocks and the rounds run as whole-array operations.
+'''
+from typing import Dict, List, Sequence
+import numpy as np
+from .sha3 import SHA3, SHA3Instance, KECCAK_RC, KECCAK_RHO
+
+ROUND_CONSTANTS = np.array(KECCAK_RC, dtype=np.uint64)
+
+# theta: rows of the column parities C[x - 1] and C[x + 1] for every lane
+THETA_PREV = np.array([(i - 1) % 5 for i in range(25)])
+THETA_NEXT = np.array([(i + 1) % 5 for i in range(25)])
+
+# rho: rotation of every lane, as (25, 1) to broadcast over the batch
+RHO_LEFT = np.array([[KECCAK_RHO[i % 5][i // 5]] for i in range(25)], dtype=np.uint64)
+RHO_RIGHT = (np.uint64(64) - RHO_LEFT) % np.uint64(64)
+
+# pi: B[y, 2x + 3y] = A[x, y], as the source row of every destination row
+PI_SOURCE = np.zeros(25, dtype=np.intp)
+for _x in range(5):
+    for _y in range(5):
+        PI_SOURCE[_y + 5 * ((2 * _x + 3 * _y) % 5)] = _x + 5 * _y
+
+# chi: rows of lanes (x + 1, y) and (x + 2, y)
+CHI_NEXT = np.array([(i // 5) * 5 + (i + 1) % 5 for i in range(25)])
+CHI_NEXT2 = np.array([(i // 5) * 5 + (i + 2) % 5 for i in range(25)])
+
+def keccak_f1600_many(lanes: np.ndarray) -> np.ndarray:
+    '''
+    Keccak-f[1600] on a (25, N) uint64 array of N states
+    '''
+    # rotations by 0 shift right by 0 as well, so (a << 0) | a == a
+    rho_left, rho_right = RHO_LEFT, RHO_RIGHT
+    one, sixty_three = np.uint64(1), np.uint64(63)
+
+    for rc in ROUND_CONSTANTS:
+        # theta
+        parity = lanes[0:5] ^ lanes[5:10] ^ lanes[10:15] ^ lanes[15:20] ^ lanes[20:25]
+        rotated = (parity << one) | (parity >> sixty_three)
+        lanes = lanes ^ parity[THETA_PREV] ^ rotated[THETA_NEXT]
+
+        # rho and pi
+        lanes = (lanes << rho_left) | (lanes >> rho_right)
+        lanes = lanes[PI_SOURCE]
+
+        # chi and iota
+        lanes = lanes ^ (~lanes[CHI_NEXT] & lanes[CHI_NEXT2])
+        lanes[0] ^= rc
+
+    return lanes
+
+def sha3_many(instance: SHA3Instance, messages: Sequence[bytes]) -> List[bytes]:
+    '''
+    Digests of every message, in order, as SHA3(instance, message).digest()
+    '''
+    hasher = SHA3(instance)
+    rate_lanes = hasher.block_size // 8
+    output_lanes = (hasher.digest_size + 7) // 8
+
+    groups: Dict[int, List[int]] = {}
+    padded = []
+    for index, message in enumerate(messages):
+        block = hasher._pad_message(bytes(message))
+        padded.append(block)
+        groups.setdefault(len(block) // hasher.block_size, []).append(index)
+
+    digests: List[bytes] = [b''] * len(padded)
+    for blocks, indices in groups.items():
+        # (blocks, rate_lanes, N) message lanes of the group
+        data = np.frombuffer(b''.join(padded[i] for i in indices), dtype='<u8')
+        data = data.reshape(len(indices), blocks, rate_lanes).transpose(1, 2, 0).astype(np.uint64)
+
+        lanes = np.zeros((25, len(indices)), dtype=np.uint64)
+        for block in data:
+            lanes[:rate_lanes] ^= block
+            lanes = keccak_f1600_many(lanes)
+
+        output = np.ascontiguousarray(lanes[:output_lanes].T, dtype='<u8').view(np.uint8)
+        output = output.reshape(len(indices), -1)[:, :hasher.digest_size]
+        for i, digest in zip(indices, output):
+            digests[i] = digest.tobytes()
+
+    return digests
+
+def sha3_224_many(messages: Sequence[bytes]) -> List[bytes]:
+    return sha3_many(SHA3Instance.SHA224, messages)
+
+def sha3_256_many(messages: Sequence[bytes]) -> List[bytes]:
+    return sha3_many(SHA3Instance.SHA256, messages)
+
+def sha3_384_many(messages: Sequence[bytes]) -> List[bytes]:
+    return sha3_many(SHA3Instance.SHA384, messages)
+
+def sha3_512_many(messages: Sequence[bytes]) -> List[bytes]:
+    return sha3_many(SHA3Instance.SHA512, messages)
@@ -1,5 +1,7 @@
 import base64
+import importlib.util
 import re
+import sys
 
 
 def char_to_int(char):
@@ -44,4 +46,33 @@ def extract_signature_from_message(appended):
     # Remove the closing </ds> tag from the signature
     signature = parts[1].rstrip("--ds--").rstrip('\u0000').rstrip('\x00')
 
-    return message, signature
\ No newline at end of file
+    return message, signature
+
+def decode_binary(data: bytes, encoding: str) -> bytes:
+    if encoding == "base64":
+        return base64.b64decode(data, validate=True)
+    if encoding == "hex":
+        return bytes.fromhex(bytes(data).decode('ascii'))
+    return data
+
+def encode_binary(data: bytes, encoding: str) -> bytes:
+    if encoding == "base64":
+        return base64.b64encode(data)
+    if encoding == "hex":
+        return data.hex().encode('ascii')
+    return data
+
+def lazy_import(name):
+    """
+    Module that is only executed when one of its attributes is first used
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
@@ -0,0 +1,164 @@
+'''
+    Block cipher benchmarks
+
+    Run from the backend directory:
+        python -m benchmarks.block_cipher [--parallel]
+'''
+import os
+import sys
+import time
+import timeit
+
+from app.crypto.block_cipher import BlockCipher, BlockCipherMode, EXPANSION, EXPANSION_PBOX
+from app.crypto.block_cipher_batch import BlockCipherBatch, blocks_to_array
+from app.crypto.lru_cache import LRUCache
+
+ROUNDS = 16
+
+
+def bench(label: str, fn, number: int) -> float:
+    seconds = min(timeit.repeat(fn, number=number, repeat=5)) / number
+    print(f"{label:<40} {seconds * 1e6:10.2f} us")
+    return seconds
+
+
+def bench_pbox(samples: int = 1000):
+    cipher = BlockCipher(b'0123456789abcdef')
+    halves = [os.urandom(8) for _ in range(samples)]
+
+    for half in halves:
+        assert cipher.apply_pbox(half, EXPANSION_PBOX) == EXPANSION.permute(half)
+        assert EXPANSION.permute_int(int.from_bytes(half, 'big')) == int.from_bytes(EXPANSION.permute(half), 'big')
+
+    half = halves[0]
+    half_int = int.from_bytes(half, 'big')
+
+    print("== expansion P-box, per block (16 rounds) ==")
+    bit_walk = bench("apply_pbox", lambda: [cipher.apply_pbox(half, EXPANSION_PBOX) for _ in range(ROUNDS)], 200)
+    table = bench("PBox.permute", lambda: [EXPANSION.permute(half) for _ in range(ROUNDS)], 2000)
+    table_int = bench("PBox.permute_int", lambda: [EXPANSION.permute_int(half_int) for _ in range(ROUNDS)], 2000)
+    print(f"speedup: {bit_walk / table:.1f}x (bytes), {bit_walk / table_int:.1f}x (int)")
+
+
+def bench_rounds(samples: int = 200):
+    cipher = BlockCipher(b'0123456789abcdef')
+    subkeys = cipher.next_subkeys([])
+    subkey_bytes = [subkey.to_bytes(16, 'big') for subkey in subkeys]
+
+    def encrypt_block_bytes(block: bytes) -> bytes:
+        left, right = block[:8], block[8:]
+        for subkey in subkey_bytes:
+            left, right = cipher.feistel_network_for_encrypt(left, right, subkey)
+        return left + right
+
+    for _ in range(samples):
+        block = os.urandom(16)
+        block_int = int.from_bytes(block, 'big')
+        encrypted = cipher.encrypt_block_int(block_int, subkeys)
+        assert encrypted == int.from_bytes(encrypt_block_bytes(block), 'big')
+        assert cipher.decrypt_block_int(encrypted, subkeys) == block_int
+
+    block = os.urandom(16)
+    block_int = int.from_bytes(block, 'big')
+
+    print("== Feistel rounds, per block (16 rounds) ==")
+    byte_rounds = bench("feistel_network_for_encrypt", lambda: encrypt_block_bytes(block), 200)
+    int_rounds = bench("encrypt_block_int", lambda: cipher.encrypt_block_int(block_int, subkeys), 2000)
+    print(f"speedup: {byte_rounds / int_rounds:.1f}x")
+
+
+def bench_batch(count: int = 10000):
+    cipher = BlockCipher(b'0123456789abcdef')
+    subkeys = list(cipher.expanded_key.subkeys)
+    batch = BlockCipherBatch(subkeys)
+    data = os.urandom(16 * count)
+    blocks = blocks_to_array(data)
+
+    def scalar():
+        return b''.join(
+            cipher.encrypt_block_int(int.from_bytes(data[i : i + 16], 'big'), subkeys).to_bytes(16, 'big')
+            for i in range(0, len(data), 16)
+        )
+
+    encrypted = batch.encrypt_blocks(blocks)
+    assert encrypted.tobytes() == scalar()
+    assert batch.decrypt_blocks(encrypted).tobytes() == data
+
+    print(f"== {count} independent blocks ==")
+    scalar_seconds = bench("encrypt_block_int", scalar, 1)
+    batch_seconds = bench("BlockCipherBatch.encrypt_blocks", lambda: batch.encrypt_blocks(blocks), 5)
+    print(f"speedup: {scalar_seconds / batch_seconds:.1f}x")
+
+
+def bench_subkeys(count: int = 4096):
+    cipher = BlockCipher(b'0123456789abcdef')
+    subkeys = cipher.iter_subkeys()
+    assert cipher.subkeys_range(0, count) == [next(subkeys) for _ in range(count)]
+
+    def one_by_one():
+        subkeys = cipher.iter_subkeys()
+        return [next(subkeys) for _ in range(count)]
+
+    print(f"== subkeys of {count} blocks ==")
+    scalar = bench("iter_subkeys", one_by_one, 1)
+    batched = bench("subkeys_range", lambda: cipher.subkeys_range(0, count), 1)
+    print(f"speedup: {scalar / batched:.1f}x")
+
+
+def bench_key_cache():
+    key = b'0123456789abcdef'
+    plaintext = os.urandom(64)
+    cache = LRUCache(maxsize=16)
+
+    assert BlockCipher(key, key_cache=cache).encrypt(plaintext) == BlockCipher(key, key_cache=None).encrypt(plaintext)
+
+    print("== key schedule cache, 64 byte request ==")
+    cold = bench("uncached", lambda: BlockCipher(key, key_cache=None).encrypt(plaintext), 20)
+    warm = bench("warm cache", lambda: BlockCipher(key, key_cache=cache).encrypt(plaintext), 20)
+    print(f"speedup: {cold / warm:.1f}x, {cache.stats()}")
+
+
+def bench_ctr(size: int = 1024 * 1024, worker_counts=(1, 2, 4)):
+    key = b'0123456789abcdef'
+    nonce = b'\x00\x01\x02\x03\x04\x05\x06\x07'
+    plaintext = os.urandom(size)
+
+    print(f"== CTR mode, {size / 1024 / 1024:.1f} MB, {os.cpu_count()} cores ==")
+    reference = None
+    for workers in worker_counts:
+        cipher = BlockCipher(key, mode=BlockCipherMode.CTR, nonce=nonce, workers=workers)
+        start = time.perf_counter()
+        ciphertext = cipher.encrypt(plaintext)
+        seconds = time.perf_counter() - start
+
+        if reference is None:
+            reference = ciphertext
+        assert ciphertext == reference
+        print(f"{workers} workers {'':<30} {size / seconds / 1024 / 1024:10.3f} MB/s")
+
+
+def bench_cbc_decrypt(size: int = 256 * 1024, worker_counts=(1, 2, 4, 8)):
+    key = b'0123456789abcdef'
+    plaintext = os.urandom(size)
+    ciphertext = BlockCipher(key, workers=1).encrypt(plaintext)
+
+    print(f"== CBC decrypt, {size / 1024 / 1024:.1f} MB, {os.cpu_count()} cores ==")
+    for workers in worker_counts:
+        cipher = BlockCipher(key, workers=workers)
+        start = time.perf_counter()
+        decrypted = cipher.decrypt(ciphertext)
+        seconds = time.perf_counter() - start
+
+        assert decrypted == plaintext
+        print(f"{workers} workers {'':<30} {size / seconds / 1024 / 1024:10.3f} MB/s")
+
+
+if __name__ == "__main__":
+    bench_pbox()
+    bench_rounds()
+    bench_batch()
+    bench_subkeys()
+    bench_key_cache()
+    if "--parallel" in sys.argv:
+        bench_ctr()
+        bench_cbc_decrypt()
@@ -0,0 +1,87 @@
+'''
+    Crib search benchmarks
+
+    Run from the backend directory:
+        python -m benchmarks.crib_search
+'''
+import os
+import random
+import time
+
+from app.crypto.crib_search import CribMachine, CribSearch
+from app.crypto.enigma import ALPHABET, EnigmaMachine, EnigmaRotor, rotor_positions_at
+from app.crypto.enigma_bytes import EnigmaBytesMachine, EnigmaBytesRotor
+
+ROTORS = (EnigmaRotor.II, EnigmaRotor.IV, EnigmaRotor.I)
+CRIB = "WETTERVORHERSAGE"
+
+
+def plant(size: int = 64, offset: int = 20):
+    message = "".join(random.choice(ALPHABET) for _ in range(size))
+    message = message[:offset] + CRIB + message[offset + len(CRIB):]
+    return EnigmaMachine(list(ROTORS), [3, 17, 22], [0, 9, 14], {}).encrypt(message)
+
+
+def brute_force(cipher_text: str, offsets, right_rings):
+    # one machine per candidate, encrypting the whole crib
+    tested = 0
+    found = []
+    for offset in offsets:
+        for right_ring in right_rings:
+            for left in range(26):
+                for middle in range(26):
+                    for right in range(26):
+                        positions = rotor_positions_at(list(ROTORS), [left, middle, right], offset)
+                        machine = EnigmaMachine(list(ROTORS), positions, [0, 9, right_ring], {})
+                        if machine.encrypt(CRIB) == cipher_text[offset:offset + len(CRIB)]:
+                            found.append((offset, left, middle, right))
+                        tested += 1
+    return tested, found
+
+
+def run(search: CribSearch):
+    start = time.perf_counter()
+    found = search.run()
+    seconds = time.perf_counter() - start
+    return found, seconds
+
+
+def bench_enigma(workers: int = os.cpu_count() or 1):
+    cipher_text = plant()
+    space = dict(offsets=range(10, 31), rotor_orders=[ROTORS], middle_rings=range(26), right_rings=[12, 13, 14, 15])
+
+    print("== letter Enigma crib search ==")
+    start = time.perf_counter()
+    tested, found = brute_force(cipher_text, [20], [14])
+    assert (20, 3, 17, 22) in found
+    per_candidate = (time.perf_counter() - start) / tested
+    print(f"{'brute force':<24}{1 / per_candidate:>12.0f} candidates/s")
+
+    for count in sorted({1, workers}):
+        search = CribSearch(cipher_text, CRIB, workers=count, **space)
+        found, seconds = run(search)
+        assert (20, (0, 9, 14), (3, 17, 22)) in [(c.offset, c.rings, c.positions) for c in found]
+        rate = search.candidate_count / seconds
+        print(f"{f'{count} worker(s)':<24}{rate:>12.0f} candidates/s, {rate / count:.0f} per core")
+    print(f"speedup per core over brute force: {search.candidate_count / seconds / workers * per_candidate:.0f}x")
+
+
+def bench_enigma_bytes(workers: int = os.cpu_count() or 1):
+    message = bytearray(random.randrange(256) for _ in range(64))
+    message[20:36] = b"known plaintext!"
+    rotors = [EnigmaBytesRotor.I] * 3
+    cipher_text = EnigmaBytesMachine(rotors, [3, 200, 17], [0, 40, 90], {}).encrypt(bytes(message))
+    space = dict(offsets=range(16, 25), middle_rings=[40], right_rings=range(88, 92), middle_positions=range(196, 204))
+
+    print("== Enigma bytes crib search ==")
+    for count in sorted({1, workers}):
+        search = CribSearch(cipher_text, b"known plaintext!", machine=CribMachine.ENIGMA_BYTES, workers=count, **space)
+        found, seconds = run(search)
+        assert (20, (0, 40, 90), (3, 200, 17)) in [(c.offset, c.rings, c.positions) for c in found]
+        rate = search.candidate_count / seconds
+        print(f"{f'{count} worker(s)':<24}{rate:>12.0f} candidates/s, {rate / count:.0f} per core")
+
+
+if __name__ == "__main__":
+    bench_enigma()
+    bench_enigma_bytes()
@@ -0,0 +1,227 @@
+'''
+    Elliptic curve benchmarks
+
+    Run from the backend directory:
+        python -m benchmarks.elliptic_curve
+'''
+import secrets
+import time
+
+from app.crypto import elliptic_curve as ec
+from benchmarks.block_cipher import bench
+
+# 2·G on secp256k1
+G2 = ec.Point(
+    0xC6047F9441ED7D6D3045406E95C07CD85C778E4B8CEF3CA7ABAC09B95C709EE5,
+    0x1AE168FEA63DC339A3C58419466CEAEEF7F632653266D0E1236431A950CFE52A
+)
+
+
+def multiply_affine(k: int, point: ec.Point = ec.G) -> ec.Point:
+    # the original double-and-add, one inverse per operation
+    current = point
+    for char in bin(k)[3:]:
+        current = ec.double(current)
+        if char == '1':
+            current = ec.add(current, point)
+    return current
+
+
+def check_multiply(samples: int = 20):
+    assert ec.multiply(1) == ec.G
+    assert ec.multiply(2) == G2
+    assert ec.multiply(ec.n + 2) == G2
+    assert ec.to_affine(ec.jacobian_add(ec.jacobian_multiply(3, ec.G), ec.to_jacobian(G2))) == ec.multiply(5)
+
+    for _ in range(samples):
+        k = secrets.randbelow(ec.n - 1) + 1
+        point = multiply_affine(secrets.randbelow(ec.n - 1) + 1)
+        assert ec.multiply(k) == multiply_affine(k)
+        assert ec.multiply(k, point) == multiply_affine(k, point)
+
+
+def check_fixed_base(windows=(1, 3, 5, 8)):
+    ks = [1, 2, ec.n - 1, ec.n + 2] + [secrets.randbelow(ec.n) for _ in range(10)]
+    expected = [multiply_affine(k % ec.n) for k in ks]
+    for window in windows:
+        table = ec.FixedBaseTable(ec.G, window)
+        assert [ec.to_affine(table.multiply(k)) for k in ks] == expected, window
+    assert ec.FixedBaseTable(ec.G, 4).multiply(ec.n).z == 0
+
+
+def check_multi_multiply(samples: int = 10):
+    for k in [0, 1, 2, 7, 2 ** 255 + 12345, secrets.randbits(256)]:
+        for width in (2, 4, 5, 8):
+            assert sum(digit << i for i, digit in enumerate(ec.wnaf(k, width))) == k
+
+    for _ in range(samples):
+        u1, u2 = secrets.randbelow(ec.n), secrets.randbelow(ec.n)
+        point = ec.multiply(secrets.randbelow(ec.n - 1) + 1)
+        expected = ec.jacobian_add(ec.jacobian_multiply(u1, ec.G), ec.jacobian_multiply(u2, point))
+        result = ec.multi_multiply([
+            (u1, ec.generator_odd_multiples(ec.GENERATOR_WNAF_WIDTH)),
+            (u2, ec.odd_multiples(point, ec.POINT_WNAF_WIDTH)),
+        ])
+        assert ec.to_affine(result) == ec.to_affine(expected)
+
+    # u1·G + u2·Q at infinity
+    assert ec.multi_multiply([(5, ec.odd_multiples(ec.G, 4)), (ec.n - 5, ec.generator_odd_multiples(8))]).z == 0
+
+
+def count_doublings(fn) -> int:
+    count = 0
+    double = ec.jacobian_double
+
+    def counted(point):
+        nonlocal count
+        count += 1
+        return double(point)
+
+    ec.jacobian_double = counted
+    try:
+        fn()
+    finally:
+        ec.jacobian_double = double
+    return count
+
+
+def check_signatures(samples: int = 10):
+    for _ in range(samples):
+        private_key = ec.gen_ecdsa_private_key()
+        public_key = ec.gen_ecdsa_public_key(private_key)
+        point = multiply_affine(int(private_key, 16))
+        assert public_key == "04" + format(point.x, '064x') + format(point.y, '064x')
+
+        digest = secrets.randbits(256)
+        nonce = secrets.randbelow(ec.n - 1) + 1
+        signature = ec.sign(int(private_key, 16), digest, nonce)
+        assert signature.r == multiply_affine(nonce).x % ec.n
+        assert ec.verify(public_key, signature, digest)
+        assert not ec.verify(public_key, signature, digest ^ 1)
+        assert not ec.verify("04" + "0" * 128, signature, digest)
+
+
+def bench_operations():
+    point = ec.multiply(secrets.randbelow(ec.n))
+    jacobian = ec.jacobian_double(ec.to_jacobian(point))
+    other = ec.to_jacobian(G2)
+
+    print("== point operations ==")
+    affine_double = bench("affine double", lambda: ec.double(point), 1000)
+    jacobian_double = bench("Jacobian double", lambda: ec.jacobian_double(jacobian), 10000)
+    affine_add = bench("affine add", lambda: ec.add(point, G2), 1000)
+    mixed_add = bench("Jacobian mixed add", lambda: ec.jacobian_add_affine(jacobian, G2), 10000)
+    bench("Jacobian add", lambda: ec.jacobian_add(jacobian, other), 10000)
+    print(f"speedup: {affine_double / jacobian_double:.1f}x (double), {affine_add / mixed_add:.1f}x (add)")
+
+
+def bench_multiply():
+    k = secrets.randbelow(ec.n)
+    private_key = ec.gen_ecdsa_private_key()
+    public_key = ec.gen_ecdsa_public_key(private_key)
+    digest = secrets.randbits(256)
+    signature = ec.sign(int(private_key, 16), digest)
+
+    print("== 256-bit scalar multiplication ==")
+    affine = bench("affine multiply", lambda: multiply_affine(k), 5)
+    jacobian = bench("multiply", lambda: ec.multiply(k), 20)
+    print(f"speedup: {affine / jacobian:.1f}x")
+
+    print("== ECDSA ==")
+    bench("gen_ecdsa_public_key", lambda: ec.gen_ecdsa_public_key(private_key), 20)
+    bench("sign", lambda: ec.sign(int(private_key, 16), digest), 20)
+    bench("verify", lambda: ec.verify(public_key, signature, digest), 10)
+
+
+def bench_fixed_base(windows=(0, 2, 4, 6, 8)):
+    private_key = ec.gen_ecdsa_private_key()
+    digest = secrets.randbits(256)
+    default = ec.GENERATOR_WINDOW
+
+    print("== generator table, keygen and sign throughput ==")
+    print(f"{'window':<8} {'points':>8} {'build ms':>10} {'keygen/s':>10} {'sign/s':>10}")
+    for window in windows:
+        ec.generator_table.cache_clear()
+        start = time.perf_counter()
+        points = len(ec.generator_table(window)) if window else 0
+        build = time.perf_counter() - start
+
+        ec.GENERATOR_WINDOW = window
+        keygen = bench(f"gen_ecdsa_public_key, window {window}", lambda: ec.gen_ecdsa_public_key(private_key), 20)
+        signing = bench(f"sign, window {window}", lambda: ec.sign(int(private_key, 16), digest), 20)
+        print(f"{window:<8} {points:>8} {build * 1e3:>10.1f} {1 / keygen:>10.0f} {1 / signing:>10.0f}")
+    ec.GENERATOR_WINDOW = default
+
+
+def bench_verify():
+    private_key = ec.gen_ecdsa_private_key()
+    public_key = ec.gen_ecdsa_public_key(private_key)
+    public_key_point = ec.Point(int(public_key[2:66], 16), int(public_key[66:], 16))
+    digest = secrets.randbits(256)
+    signature = ec.sign(int(private_key, 16), digest)
+
+    def verify_separately() -> bool:
+        # u1·G and u2·Q by two double-and-add passes, as before multi_multiply
+        s_inv = ec.inverse(signature.s, ec.n)
+        point1 = ec.jacobian_multiply((s_inv * digest) % ec.n, ec.G)
+        point2 = ec.jacobian_multiply((s_inv * signature.r) % ec.n, public_key_point)
+        return ec.to_affine(ec.jacobian_add(point1, point2)).x == signature.r
+
+    assert verify_separately() and ec.verify(public_key, signature, digest)
+
+    print("== verify ==")
+    print(f"doublings: {count_doublings(verify_separately)} separately, "
+          f"{count_doublings(lambda: ec.verify(public_key, signature, digest))} interleaved")
+    separate = bench("two double-and-add passes", verify_separately, 10)
+    interleaved = bench("verify (interleaved wNAF)", lambda: ec.verify(public_key, signature, digest), 10)
+    print(f"speedup: {separate / interleaved:.1f}x")
+
+
+def bench_public_key_cache(keys: int = 20, verifies: int = 200):
+    point = ec.multiply(secrets.randbelow(ec.n - 1) + 1)
+    k = secrets.randbelow(ec.n)
+    assert ec.to_affine(ec.wnaf_multiply(k, point)) == ec.to_affine(ec.jacobian_multiply(k, point))
+
+    print("== arbitrary point multiplication ==")
+    binary = bench("double-and-add", lambda: ec.jacobian_multiply(k, point), 20)
+    wnaf = bench("wNAF", lambda: ec.wnaf_multiply(k, point), 20)
+    print(f"speedup: {binary / wnaf:.1f}x")
+
+    # a few keys verified over and over, as behind /elliptic_curve/verify
+    signed = []
+    for _ in range(keys):
+        private_key = ec.gen_ecdsa_private_key()
+        digest = secrets.randbits(256)
+        signed.append((ec.gen_ecdsa_public_key(private_key), ec.sign(int(private_key, 16), digest), digest))
+    requests = [signed[i % keys] for i in range(verifies)]
+
+    def verify_all():
+        return all(ec.verify(public_key, signature, digest) for public_key, signature, digest in requests)
+
+    print(f"== {verifies} verifies over {keys} public keys ==")
+    public_key = signed[0][0]
+    bench("parse_public_key (miss)", lambda: ec.parse_public_key(public_key), 100)
+    bench("load_public_key (hit)", lambda: ec.load_public_key(public_key), 1000)
+
+    cache = ec.PUBLIC_KEY_CACHE
+    ec.PUBLIC_KEY_CACHE = ec.LRUCache(maxsize=0)
+    assert verify_all()
+    uncached = bench("verify, no key cache", verify_all, 1)
+
+    ec.PUBLIC_KEY_CACHE = ec.LRUCache(maxsize=keys)
+    assert verify_all()
+    cached = bench("verify, key cache", verify_all, 1)
+    print(f"speedup: {uncached / cached:.1f}x, {ec.PUBLIC_KEY_CACHE.stats()}")
+    ec.PUBLIC_KEY_CACHE = cache
+
+
+if __name__ == "__main__":
+    check_multiply()
+    check_fixed_base()
+    check_multi_multiply()
+    check_signatures()
+    bench_operations()
+    bench_multiply()
+    bench_fixed_base()
+    bench_verify()
+    bench_public_key_cache()
@@ -0,0 +1,57 @@
+'''
+    Letter Enigma benchmarks
+
+    Run from the backend directory:
+        python -m benchmarks.enigma
+'''
+import random
+
+from app.crypto.enigma import ALPHABET, EnigmaMachine, EnigmaRotor
+from benchmarks.block_cipher import bench
+
+ROTORS = [EnigmaRotor.I, EnigmaRotor.II, EnigmaRotor.III]
+
+
+def machine() -> EnigmaMachine:
+    return EnigmaMachine(rotors=ROTORS, positions=[0, 3, 20], rings=[1, 2, 3], plugboard={"A": "Z", "Q": "W"})
+
+
+def encrypt_per_letter(machine: EnigmaMachine, message: str) -> str:
+    # rotor by rotor, one letter at a time
+    cipher_text = ""
+    for letter in message:
+        machine._advance_rotors()
+        letter = machine._plugboard_substitution(letter)
+        letter = machine._forward_substitution(letter)
+        letter = machine._reflector_substitution(letter)
+        letter = machine._backward_substitution(letter)
+        letter = machine._plugboard_substitution(letter)
+        cipher_text += letter
+    return cipher_text
+
+
+def bench_encrypt(size: int = 64 * 1024):
+    message = "".join(random.choice(ALPHABET) for _ in range(size))
+
+    assert EnigmaMachine(ROTORS, [0, 0, 0], [0, 0, 0], {}).encrypt("AAAAA") == "BDZGO"
+    reference, compiled = machine(), machine()
+    assert encrypt_per_letter(reference, message) == compiled.encrypt(message)
+    assert reference.rotor_positions == compiled.rotor_positions
+    assert machine().encrypt(machine().encrypt(message)) == message
+
+    print(f"== encrypt, {size // 1024} K letters ==")
+    per_letter = bench("per letter", lambda: encrypt_per_letter(machine(), message), 1)
+    tables = bench("compiled tables", lambda: machine().encrypt(message), 5)
+    print(f"speedup: {per_letter / tables:.1f}x, {size / tables / 1e6:.2f} M letters/s")
+
+
+def bench_large(size: int = 1024 * 1024):
+    message = "".join(random.choice(ALPHABET) for _ in range(size))
+    print(f"== encrypt, {size // 1024 // 1024} M letters ==")
+    seconds = bench("compiled tables", lambda: machine().encrypt(message), 1)
+    print(f"{size / seconds / 1e6:.2f} M letters/s")
+
+
+if __name__ == "__main__":
+    bench_encrypt()
+    bench_large()
@@ -0,0 +1,139 @@
+'''
+    Byte Enigma benchmarks
+
+    Run from the backend directory:
+        python -m benchmarks.enigma_bytes
+'''
+import os
+import time
+import tracemalloc
+
+from app.crypto.enigma_bytes import EnigmaBytesMachine, EnigmaBytesRotor
+from app.crypto.enigma_bytes_batch import EnigmaBytesBatch
+from benchmarks.block_cipher import bench
+
+ROTORS = [EnigmaBytesRotor.I, EnigmaBytesRotor.I, EnigmaBytesRotor.I]
+
+
+def machine(positions=(1, 0x3A, 245), rings=(1, 200, 100)) -> EnigmaBytesMachine:
+    return EnigmaBytesMachine(rotors=list(ROTORS), positions=list(positions), rings=list(rings), plugboard={})
+
+
+def encrypt_per_letter(machine: EnigmaBytesMachine, message: bytes) -> bytes:
+    # the original rotor by rotor path, one byte at a time
+    cipher_text = b""
+    for letter in message:
+        machine._advance_rotors()
+        letter = machine._plugboard_substitution(letter)
+        letter = machine._forward_substitution(letter)
+        letter = machine._reflector_substitution(letter)
+        letter = machine._backward_substitution(letter)
+        letter = machine._plugboard_substitution(letter)
+        cipher_text += bytes([letter])
+    return cipher_text
+
+
+def bench_encrypt(size: int = 64 * 1024):
+    message = os.urandom(size)
+
+    reference, compiled = machine(), machine()
+    assert encrypt_per_letter(reference, message) == compiled.encrypt(message)
+    assert reference.rotor_positions == compiled.rotor_positions
+
+    state = machine()
+    state._advance_rotors()
+    assert bytes(state.state_table()[letter] for letter in message[:1]) == machine().encrypt(message[:1])
+
+    print(f"== encrypt, {size // 1024} KB ==")
+    per_letter = bench("per letter", lambda: encrypt_per_letter(machine(), message), 1)
+    tables = bench("compiled tables", lambda: machine().encrypt(message), 5)
+    print(f"speedup: {per_letter / tables:.1f}x, {size / tables / 1024 / 1024:.2f} MB/s")
+
+
+def bench_seek(offset: int = 200000):
+    message = os.urandom(4096)
+    cipher_text = machine().encrypt(message)
+    for start in (0, 1, 255, 256, 1000, 4095):
+        random_access = machine()
+        random_access.seek(start)
+        assert random_access.encrypt(message[start:]) == cipher_text[start:]
+
+    def step(count: int):
+        stepped = machine()
+        for _ in range(count):
+            stepped._advance_rotors()
+        return list(stepped.rotor_positions)
+
+    assert step(offset) == machine().state_at(offset)
+
+    print(f"== rotor positions at byte {offset} ==")
+    stepping = bench("_advance_rotors loop", lambda: step(offset), 1)
+    closed_form = bench("state_at", lambda: machine().state_at(offset), 10000)
+    print(f"speedup: {stepping / closed_form:.0f}x, period {machine().period()}")
+
+
+def measure(fn):
+    start = time.perf_counter()
+    fn()
+    seconds = time.perf_counter() - start
+
+    # timed separately, tracing every allocation slows the loop down
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds, peak
+
+
+def bench_scaling(sizes=(16 * 1024, 64 * 1024, 256 * 1024, 1024 * 1024), per_letter_limit: int = 256 * 1024):
+    print("== throughput and peak memory by message size ==")
+    for size in sizes:
+        message = os.urandom(size)
+        output = bytearray(size)
+
+        encrypted = machine().encrypt(message)
+        machine().encrypt_into(message, output)
+        assert output == encrypted
+
+        rows = [
+            ("encrypt", lambda: machine().encrypt(message)),
+            ("encrypt_into", lambda: machine().encrypt_into(message, output)),
+        ]
+        if size <= per_letter_limit:
+            rows.insert(0, ("per letter (bytes +=)", lambda: encrypt_per_letter(machine(), message)))
+
+        for label, fn in rows:
+            seconds, peak = measure(fn)
+            print(f"{size // 1024:>5} KB {label:<24} {size / seconds / 1024 / 1024:8.2f} MB/s {peak / 1024:10.1f} KB peak")
+
+
+def bench_batch(count: int = 4096, length: int = 64):
+    positions = [list(os.urandom(3)) for _ in range(count)]
+    rings = [list(os.urandom(3)) for _ in range(count)]
+    messages = [os.urandom(length) for _ in range(count)]
+
+    def machines():
+        return [machine(position, ring) for position, ring in zip(positions, rings)]
+
+    def one_by_one():
+        return [each.encrypt(message) for each, message in zip(machines(), messages)]
+
+    def batched():
+        return EnigmaBytesBatch(ROTORS, positions, rings).encrypt(messages)
+
+    expected = machines()
+    batch = EnigmaBytesBatch.from_machines(machines())
+    assert [row.tobytes() for row in batch.encrypt(messages)] == [each.encrypt(message) for each, message in zip(expected, messages)]
+    assert batch.positions.tolist() == [list(each.rotor_positions) for each in expected]
+
+    print(f"== {count} machines, {length} bytes each ==")
+    loop = bench("EnigmaBytesMachine.encrypt", one_by_one, 1)
+    vectorised = bench("EnigmaBytesBatch.encrypt", batched, 1)
+    print(f"speedup: {loop / vectorised:.1f}x")
+
+
+if __name__ == "__main__":
+    bench_encrypt()
+    bench_seek()
+    bench_scaling()
+    bench_batch()
@@ -0,0 +1,175 @@
+'''
+    SHA3 benchmarks
+
+    Run from the backend directory:
+        python -m benchmarks.sha3 [--parallel]
+'''
+import hashlib
+import io
+import mmap
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+
+from app.crypto.sha3 import SHA3, SHA3Instance, SHAKE, keccak_f1600
+from app.crypto.parallel_hash import CSHAKE, ParallelHash
+from app.crypto.sha3_batch import keccak_f1600_many, sha3_many, sha3_256_many
+from benchmarks.block_cipher import bench
+
+HASHLIB = {
+    SHA3Instance.SHA224: hashlib.sha3_224,
+    SHA3Instance.SHA256: hashlib.sha3_256,
+    SHA3Instance.SHA384: hashlib.sha3_384,
+    SHA3Instance.SHA512: hashlib.sha3_512,
+}
+
+SHAKE_HASHLIB = {
+    SHA3Instance.SHAKE128: hashlib.shake_128,
+    SHA3Instance.SHAKE256: hashlib.shake_256,
+}
+
+
+def check_vectors():
+    # every length around the rate boundaries, against hashlib
+    for instance, reference in HASHLIB.items():
+        for size in list(range(0, 300)) + [1000, 4096]:
+            message = os.urandom(size)
+            assert SHA3(instance, message).digest() == reference(message).digest(), (instance, size)
+
+            # the same message fed in uneven pieces
+            sha3 = SHA3(instance)
+            for offset in range(0, size, 97):
+                sha3.update(message[offset:offset + 97])
+            assert sha3.copy().digest() == reference(message).digest(), (instance, size)
+
+
+def check_inputs(size: int = 2 * 1024 * 1024 + 17):
+    # every accepted input type hashes to the same digest
+    message = os.urandom(size)
+    expected = hashlib.sha3_256(message).digest()
+
+    assert SHA3(SHA3Instance.SHA256, bytearray(message)).digest() == expected
+    assert SHA3(SHA3Instance.SHA256, memoryview(message)).digest() == expected
+    assert SHA3(SHA3Instance.SHA256, io.BytesIO(message)).digest() == expected
+
+    with tempfile.TemporaryFile() as file:
+        file.write(message)
+        file.seek(0)
+        assert SHA3(SHA3Instance.SHA256, file).digest() == expected
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            assert SHA3(SHA3Instance.SHA256, mapped).digest() == expected
+
+
+def check_shake():
+    # digests of every length around the rate, and the same output read in pieces
+    for instance, reference in SHAKE_HASHLIB.items():
+        for size in [0, 1, 135, 136, 167, 168, 169, 1000]:
+            message = os.urandom(size)
+            shake = SHAKE(instance, message)
+            expected = reference(message).digest(2000)
+
+            for length in [0, 1, 32, 135, 136, 168, 169, 337, 2000]:
+                assert shake.digest(length) == expected[:length], (instance, size, length)
+
+            output = b''.join(shake.read(n) for n in [1, 7, 160, 0, 300, 1532])
+            assert output == expected, (instance, size)
+            assert shake.digest(64) == expected[:64], (instance, size)
+
+
+def check_parallel_hash():
+    # NIST SP 800-185 samples for cSHAKE and ParallelHash
+    assert CSHAKE(SHA3Instance.SHAKE128, bytes(range(4)), b'', b'Email Signature').hexdigest(32) == \
+        'c1c36925b6409a04f1b504fcbca9d82b4017277cb5ed2b2065fc1d3814d5aaf5'
+
+    message = bytes.fromhex('000102030405060710111213141516172021222324252627')
+    samples = [
+        (SHA3Instance.SHAKE128, b'', 'ba8dc1d1d979331d3f813603c67f72609ab5e44b94a0b8f9af46514454a2b4f5'),
+        (SHA3Instance.SHAKE128, b'Parallel Data', 'fc484dcb3f84dceedc353438151bee58157d6efed0445a81f165e495795b7206'),
+        (SHA3Instance.SHAKE256, b'', 'bc1ef124da34495e948ead207dd9842235da432d2bbc54b4c110e64c45110553'
+                                     '1b7f2a3e0ce055c02805e7c2de1fb746af97a1dd01f43b824e31b87612410429'),
+        (SHA3Instance.SHAKE256, b'Parallel Data', 'cdf15289b54f6212b4bc270528b49526006dd9b54e2b6add1ef6900dda3963bb'
+                                                  '33a72491f236969ca8afaea29c682d47a393c065b38e29fae651a2091c833110'),
+    ]
+    for instance, customization, expected in samples:
+        assert ParallelHash(instance, message, 8, customization).hexdigest() == expected, (instance, customization)
+
+    # the process pool and uneven updates give the serial digest
+    message = os.urandom(3 * 1024 * 1024 + 5)
+    expected = ParallelHash(SHA3Instance.SHAKE128, message).digest()
+    hasher = ParallelHash(SHA3Instance.SHAKE128, workers=2)
+    for offset in range(0, len(message), 700000):
+        hasher.update(message[offset:offset + 700000])
+    assert hasher.digest() == expected
+
+
+def bench_permutation():
+    print("== Keccak-f[1600] ==")
+    bench("lanes", lambda: keccak_f1600([0] * 25), 200)
+
+
+def bench_digest(size: int = 64 * 1024):
+    message = os.urandom(size)
+    block_size = SHA3(SHA3Instance.SHA256).block_size
+
+    print(f"== SHA3-256, {size // 1024} KB ==")
+    lanes = bench("SHA3", lambda: SHA3(SHA3Instance.SHA256, message).digest(), 1)
+    native = bench("hashlib.sha3_256", lambda: hashlib.sha3_256(message).digest(), 100)
+    blocks = size // block_size + 1
+    print(f"{lanes / blocks * 1e6:.1f} us per block, {lanes / native:.0f}x hashlib")
+
+
+def bench_shake(size: int = 64 * 1024):
+    shake = SHAKE(SHA3Instance.SHAKE128, b'seed')
+    reference = hashlib.shake_128(b'seed')
+
+    print(f"== SHAKE128 output, {size // 1024} KB ==")
+    streamed = bench("SHAKE.read (4 KB reads)", lambda: [shake.read(4096) for _ in range(size // 4096)], 1)
+    native = bench("hashlib.shake_128.digest", lambda: reference.digest(size), 100)
+    print(f"{size / streamed / 1e6:.2f} MB/s, {streamed / native:.0f}x hashlib")
+
+
+def bench_batch(count: int = 10000):
+    # short messages of mixed lengths, one to three blocks each
+    messages = [os.urandom(size) for size in (os.urandom(count))]
+    messages += [os.urandom(300) for _ in range(count // 10)]
+
+    states = np.frombuffer(os.urandom(25 * 8 * 100), dtype=np.uint64).reshape(25, 100)
+    assert keccak_f1600_many(states)[:, 7].tolist() == keccak_f1600(states[:, 7].tolist())
+    for instance, reference in HASHLIB.items():
+        assert sha3_many(instance, messages[:500] + messages[-50:]) == [reference(m).digest() for m in messages[:500] + messages[-50:]], instance
+
+    print(f"== SHA3-256, {len(messages)} short messages ==")
+    single = bench("SHA3 per message", lambda: [SHA3(SHA3Instance.SHA256, m).digest() for m in messages], 1)
+    batched = bench("sha3_256_many", lambda: sha3_256_many(messages), 1)
+    print(f"{len(messages) / batched:.0f} messages/s, speedup: {single / batched:.1f}x")
+
+
+def bench_parallel_hash(size: int = 100 * 1024 * 1024, worker_counts=(1, 2, 4, 8)):
+    message = os.urandom(size)
+
+    print(f"== ParallelHash128, {size / 1024 / 1024:.0f} MB, {os.cpu_count()} cores ==")
+    reference = None
+    for workers in worker_counts:
+        start = time.perf_counter()
+        digest = ParallelHash(SHA3Instance.SHAKE128, message, workers=workers).digest()
+        seconds = time.perf_counter() - start
+
+        if reference is None:
+            reference = digest
+        assert digest == reference
+        print(f"{workers} workers {'':<30} {size / seconds / 1024 / 1024:10.3f} MB/s")
+
+
+if __name__ == "__main__":
+    check_vectors()
+    check_inputs()
+    check_shake()
+    check_parallel_hash()
+    bench_permutation()
+    bench_digest()
+    bench_shake()
+    bench_batch()
+    if "--parallel" in sys.argv:
+        bench_parallel_hash()
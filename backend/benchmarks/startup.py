@@ -0,0 +1,87 @@
+'''
+    Application startup benchmarks
+
+    Every measurement runs in a fresh interpreter, as a newly started worker.
+
+    Run from the backend directory:
+        python -m benchmarks.startup
+'''
+import json
+import os
+import subprocess
+import sys
+
+RUNS = 5
+
+# the first request of every endpoint family, as (label, method, path, headers, body)
+FIRST_REQUESTS = [
+    ("root", "GET", "/", {}, b""),
+    ("block_cipher", "POST", "/block_cipher/encrypt_bytes?encoding=hex", {"x-key": "0123456789abcdef"}, b"hello world"),
+    ("enigma", "POST", "/enigma/encrypt", {"content-type": "application/json"}, b'{"texts": ["HELLOWORLD"]}'),
+    ("sha3", "POST", "/sha3/digest", {}, b"hello world"),
+    ("elliptic_curve", "GET", "/elliptic_curve/generate_key", {}, b""),
+]
+
+# run in the child interpreter: time `import app.api`, then one request through ASGI
+CHILD = '''
+import asyncio, json, sys, time
+
+start = time.perf_counter()
+import app.api
+imported = time.perf_counter() - start
+
+method, path, headers, body = json.loads(sys.argv[1])
+
+async def request():
+    path_only, _, query = path.partition("?")
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": method, "scheme": "http", "path": path_only, "raw_path": path_only.encode(),
+        "query_string": query.encode(), "root_path": "", "client": ("127.0.0.1", 0), "server": ("127.0.0.1", 8000),
+        "headers": [(k.encode(), v.encode()) for k, v in headers.items()] + [(b"content-length", str(len(body)).encode())],
+    }
+    messages = [{"type": "http.request", "body": body.encode("latin-1"), "more_body": False}]
+    status = []
+
+    async def receive():
+        return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status.append(message["status"])
+
+    await app.api.app.router.startup()
+    await app.api.app(scope, receive, send)
+    return status[0]
+
+status = asyncio.run(request())
+print(json.dumps({"import": imported, "first_response": time.perf_counter() - start, "status": status}))
+'''
+
+
+def run_child(method: str, path: str, headers: dict, body: bytes, env: dict) -> dict:
+    backend = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD, json.dumps([method, path, headers, body.decode("latin-1")])],
+        cwd=backend, env=env, capture_output=True, check=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def bench_startup(warm_up: str = ""):
+    env = dict(os.environ, CRYPTO_WARM_UP=warm_up)
+    print(f"== cold start, CRYPTO_WARM_UP={warm_up!r}, best of {RUNS} ==")
+    print(f"{'first request':<20} {'import app.api':>16} {'first response':>16}")
+
+    for label, method, path, headers, body in FIRST_REQUESTS:
+        results = [run_child(method, path, headers, body, env) for _ in range(RUNS)]
+        assert all(result["status"] == 200 for result in results), (label, results)
+
+        imported = min(result["import"] for result in results)
+        first_response = min(result["first_response"] for result in results)
+        print(f"{label:<20} {imported * 1e3:13.1f} ms {first_response * 1e3:13.1f} ms")
+
+
+if __name__ == "__main__":
+    bench_startup()
+    bench_startup("all")